@@ -0,0 +1,52 @@
+"""
+Prints each measurement of two benchmarks.run results files with its ratio to the baseline:
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+# for these bigger is better, for everything else (timings) smaller is
+THROUGHPUTS = [
+    "predict_rows_per_second",
+    "predict_batch_rows_per_second",
+    "predict_batch_matrix_rows_per_second",
+    "compiled_rows_per_second",
+]
+MEASUREMENTS = ["seconds", "to_python_code_seconds", "peak_memory", "solver_peak_memory", "nonzeros"] + THROUGHPUTS
+
+
+def _load(path):
+    with open(path) as results_file:
+        results = json.load(results_file)
+    return results["metadata"], {(result["kind"], result["name"]): result for result in results["results"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args(argv)
+
+    baseline_metadata, baseline = _load(args.baseline)
+    candidate_metadata, candidate = _load(args.candidate)
+    print(f"baseline {baseline_metadata['commit']}, candidate {candidate_metadata['commit']}")
+    for key in [key for key in baseline if key in candidate]:
+        for measurement in MEASUREMENTS:
+            before = baseline[key].get(measurement)
+            after = candidate[key].get(measurement)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            better = ratio > 1 if measurement in THROUGHPUTS else ratio < 1
+            print(
+                f"{key[0]:>9} {key[1]:<12} {measurement:<38} {before:>14.6g} {after:>14.6g} "
+                f"{ratio:>7.2f}x {'better' if better else 'worse' if ratio != 1 else ''}"
+            )
+        if baseline[key].get("depth") != candidate[key].get("depth"):
+            print(f"{key[0]:>9} {key[1]:<12} depth changed from {baseline[key]['depth']} to {candidate[key]['depth']}")
+
+
+if __name__ == "__main__":
+    main()
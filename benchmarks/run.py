@@ -0,0 +1,167 @@
+"""
+Benchmarks training and inference, writing JSON for benchmarks.compare:
+
+    python -m benchmarks.run --output before.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import numpy as np
+import pulp
+from perfectdt import Model, SolverConfig
+from perfectdt.report import DepthAttempt
+from . import targets
+
+
+def _best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def benchmark_fit(name, inputs, outputs, repeat, coefficient_bound=None):
+    runs = []
+    for _ in range(repeat):
+        model = Model()
+        start = time.perf_counter()
+        model.fit(inputs, outputs, coefficient_bound=coefficient_bound, solver=SolverConfig(msg=False))
+        runs.append((time.perf_counter() - start, model))
+    seconds, model = min(runs, key=lambda run: run[0])
+    report = model.fit_report
+    return model, {
+        "name": name,
+        "kind": "fit",
+        "rows": len(inputs),
+        "seconds": seconds,
+        "depth": model.depth,
+        "phases": report.phases,
+        "attempts": [
+            {
+                "depth": attempt.depth,
+                "outcome": attempt.outcome,
+                "variables": attempt.variables,
+                "constraints": attempt.constraints,
+                "nonzeros": attempt.nonzeros,
+                "nodes": attempt.nodes,
+                "solve_seconds": attempt.phases.get("solve"),
+            }
+            for attempt in report.attempts
+        ],
+        "peak_memory": report.peak_memory,
+        "solver_peak_memory": report.solver_peak_memory,
+    }
+
+
+def benchmark_inference(name, model, inputs, rows, repeat):
+    batch = (inputs * (rows // len(inputs) + 1))[:rows]
+    vectors = model.input_vectoriser.to_vectors(batch)
+    args = model.input_vectoriser.get_args().split(", ")
+    compiled = model.compile()
+    arg_rows = [[row.get(arg) for arg in args] for row in batch]
+    predict_seconds = _best_of(repeat, lambda: [model.predict(row) for row in batch])
+    batch_seconds = _best_of(repeat, lambda: model.predict_batch(batch))
+    matrix_seconds = _best_of(repeat, lambda: model.predict_batch(vectors, as_matrix=True))
+    compiled_seconds = _best_of(repeat, lambda: [compiled(*row) for row in arg_rows])
+    return {
+        "name": name,
+        "kind": "inference",
+        "rows": rows,
+        "predict_rows_per_second": rows / predict_seconds,
+        "predict_batch_rows_per_second": rows / batch_seconds,
+        "predict_batch_matrix_rows_per_second": rows / matrix_seconds,
+        "compiled_rows_per_second": rows / compiled_seconds,
+        "to_python_code_seconds": _best_of(repeat, lambda: model.to_python_code("benchmark")),
+    }
+
+
+def benchmark_build(name, inputs, outputs, depth, repeat, coefficient_bound=None):
+    """
+    Times building the problem for a depth without solving it, for datasets too big to solve here.
+    """
+    model = Model()
+    model.fit(inputs, outputs, freeze=False, solve=False, coefficient_bound=coefficient_bound)
+    attempt = DepthAttempt(depth=depth, rows=len(model.trained_inputs))
+    seconds = _best_of(repeat, lambda: model._make_problem(depth, attempt=attempt))
+    return {
+        "name": name,
+        "kind": "build",
+        "rows": len(inputs),
+        "depth": depth,
+        "seconds": seconds,
+        "variables": attempt.variables,
+        "constraints": attempt.constraints,
+        "nonzeros": attempt.nonzeros,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--targets", nargs="*", default=list(targets.TARGETS), help="named targets to fit")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--inference-rows", type=int, default=10000)
+    parser.add_argument("--synthetic-rows", type=int, default=20)
+    parser.add_argument("--synthetic-features", type=int, default=2)
+    parser.add_argument("--synthetic-nullable", type=int, default=0)
+    parser.add_argument("--synthetic-depth", type=int, default=2)
+    parser.add_argument("--build-rows", type=int, default=2000)
+    parser.add_argument("--build-features", type=int, default=10)
+    parser.add_argument("--build-depth", type=int, default=4)
+    parser.add_argument(
+        "--coefficient-bound", type=float, default=None, help="fit with per row big-M values from this bound"
+    )
+    args = parser.parse_args(argv)
+
+    datasets = {name: targets.TARGETS[name]() for name in args.targets}
+    if args.synthetic_rows > 0:
+        datasets["synthetic"] = targets.synthetic(
+            args.synthetic_rows, args.synthetic_features, args.synthetic_nullable, args.synthetic_depth
+        )
+
+    results = []
+    for name, (inputs, outputs) in datasets.items():
+        model, fit_result = benchmark_fit(name, inputs, outputs, args.repeat, args.coefficient_bound)
+        results.append(fit_result)
+        results.append(benchmark_inference(name, model, inputs, args.inference_rows, args.repeat))
+        print(f"{name}: fit in {fit_result['seconds']:.3f}s at depth {fit_result['depth']}", flush=True)
+
+    if args.build_rows > 0:
+        inputs, outputs = targets.synthetic(args.build_rows, args.build_features, 0, args.build_depth)
+        results.append(benchmark_build("build", inputs, outputs, args.build_depth, args.repeat, args.coefficient_bound))
+        print(f"build: {results[-1]['seconds']:.3f}s for {results[-1]['nonzeros']} nonzeros", flush=True)
+
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "metadata": {
+                    "commit": _git_commit(),
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "numpy": np.__version__,
+                    "pulp": pulp.__version__,
+                    "args": vars(args),
+                },
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main()
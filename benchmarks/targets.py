@@ -0,0 +1,85 @@
+"""
+Datasets to benchmark against. The named targets are the functions from tests/test_basic_usage.py,
+synthetic() generates random piecewise linear functions of a chosen size.
+"""
+
+import random
+
+
+def relu():
+    inputs = [{"x": x} for x in [-2, -1, 0, 1, 2]]
+    return inputs, [{"y": max(0, d["x"])} for d in inputs]
+
+
+def max_of_two():
+    inputs = [{"x": x, "y": y} for x in range(-3, 3) for y in range(-3, 3)]
+    return inputs, [{"z": max(d["x"], d["y"])} for d in inputs]
+
+
+def step():
+    inputs = [{"x": x} for x in [0, 1, 2, 3]]
+    return inputs, [{"y": y} for y in [-1, -1, 1, 1]]
+
+
+def x_or_y():
+    options = [0, 1, 2, None]
+    inputs = [{"x": x, "y": y} for x in options for y in options]
+    return inputs, [{"z": d["x"] if d["x"] is not None else d["y"]} for d in inputs]
+
+
+def both_none():
+    options = [0, 1, None]
+    inputs = [{"x": x, "y": y} for x in options for y in options]
+    return inputs, [{"z": 10 if d["x"] is None and d["y"] is None else 0} for d in inputs]
+
+
+def synthetic(rows=20, features=2, nullable=0, depth=2, seed=0):
+    """
+    A random piecewise linear function that a tree of the given depth fits exactly. The first nullable
+    features are None a quarter of the time, counting as 0 plus an extra constant.
+    """
+    rng = random.Random(seed)
+    keys = [f"x{i}" for i in range(features)]
+
+    def make_node(level):
+        if level == depth:
+            return {
+                "coefficients": [rng.randint(-3, 3) for _ in keys],
+                "null_terms": [rng.randint(-3, 3) for _ in keys[:nullable]],
+                "constant": rng.randint(-5, 5),
+            }
+        a, b = rng.sample(range(features), 2) if features > 1 else (0, 0)
+        return {
+            "split": (a, b, rng.randint(-2, 2)),
+            "greater": make_node(level + 1),
+            "less": make_node(level + 1),
+        }
+
+    tree = make_node(1)
+
+    def evaluate(row):
+        values = [row[key] or 0 for key in keys]
+        node = tree
+        while "split" in node:
+            a, b, constant = node["split"]
+            node = node["greater"] if values[a] - (values[b] if a != b else 0) + constant >= 0 else node["less"]
+        result = node["constant"] + sum(c * v for c, v in zip(node["coefficients"], values))
+        result += sum(c for c, key in zip(node["null_terms"], keys) if row[key] is None)
+        return {"y": result}
+
+    inputs = []
+    for _ in range(rows):
+        row = {}
+        for i, key in enumerate(keys):
+            row[key] = None if i < nullable and rng.random() < 0.25 else rng.randint(-5, 5)
+        inputs.append(row)
+    return inputs, [evaluate(row) for row in inputs]
+
+
+TARGETS = {
+    "relu": relu,
+    "max": max_of_two,
+    "step": step,
+    "x_or_y": x_or_y,
+    "both_none": both_none,
+}
@@ -1 +1,3 @@
+from .cache import ModelCache
 from .model import Model
+from .solver import SolverConfig, SolverTimeout
@@ -0,0 +1,116 @@
+"""
+An on disk cache of what is known about fitting a dataset at each depth.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from . import storage
+from .flat_tree import FlatTree
+from .solver import FEASIBLE, INFEASIBLE
+
+# Bumped whenever a change to the formulation means cached results no longer hold
+CACHE_VERSION = 2
+TREE_ARRAYS = ["condition_maps", "greater", "less", "leaf_maps"]
+
+
+class ModelCache:
+    """
+    Remembers the infeasible depths and feasible trees of each dataset and settings, in a directory per
+    key with a file per depth. With max_bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, model):
+        """
+        The entry for model's training data and settings. Time limits, threads and msg are left out since
+        they change how long the solver takes, not what it finds.
+        """
+        digest = hashlib.sha256()
+        for array in [model.trained_inputs, model.trained_outputs]:
+            array = np.ascontiguousarray(array, dtype=float)
+            digest.update(json.dumps(array.shape).encode())
+            digest.update(array.tobytes())
+        settings = {
+            "version": CACHE_VERSION,
+            "input_vectoriser": model.input_vectoriser.to_dict(),
+            "output_vectoriser": model.output_vectoriser.to_dict(),
+            "regularise": model.regularise,
+            "break_symmetry": model.break_symmetry,
+            "lazy_rows": model.lazy_rows,
+            "coefficient_bound": model.coefficient_bound,
+            "tolerance": model.tolerance,
+            "residual": model.residual,
+            "backend": model.solver.backend,
+            "mip_gap": model.solver.mip_gap,
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def lookup(self, key, depth):
+        """
+        Returns (outcome, tree) for depth if the entry has it, either (INFEASIBLE, None) or (FEASIBLE,
+        FlatTree). Returns None otherwise.
+        """
+        path = self._path(key, depth)
+        try:
+            metadata, arrays = storage.read(path, mmap=False)
+            # reading an entry counts as using it
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        if metadata["outcome"] == INFEASIBLE:
+            return INFEASIBLE, None
+        return FEASIBLE, FlatTree(**{name: arrays[name] for name in TREE_ARRAYS})
+
+    def record(self, key, depth, outcome, tree=None):
+        """
+        Adds the outcome of depth to the entry, with the tree that was found when it is feasible.
+        Undecided depths aren't recorded.
+        """
+        if outcome not in [FEASIBLE, INFEASIBLE]:
+            return
+        arrays = {} if outcome == INFEASIBLE else {name: getattr(tree, name) for name in TREE_ARRAYS}
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(handle)
+        try:
+            storage.write(temporary_path, {"outcome": outcome}, arrays)
+            os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+            os.replace(temporary_path, self._path(key, depth))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        self._evict()
+
+    def _path(self, key, depth):
+        return os.path.join(self.directory, key, f"{depth}.pdt")
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            # an entry was last used when any of its depths was
+            last_used, size = 0, 0
+            for depth_entry in os.scandir(entry.path):
+                try:
+                    stat = depth_entry.stat()
+                except FileNotFoundError:
+                    continue
+                last_used, size = max(last_used, stat.st_mtime), size + stat.st_size
+            entries.append((last_used, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
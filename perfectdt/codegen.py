@@ -0,0 +1,120 @@
+"""
+Writes the python code of a tree to a file-like object a line at a time, see Model.write_python_code.
+"""
+
+
+class ExpressionCache:
+    """
+    The code of each condition and leaf map, worked out once for each distinct map however many nodes
+    have it. The vectorisers' scale maps are worked out once up front instead of for every key of every
+    map.
+    """
+
+    def __init__(self, input_vectoriser, output_vectoriser):
+        self.input_vectoriser = input_vectoriser
+        self.output_vectoriser = output_vectoriser
+        self.input_scale_maps = input_vectoriser.scale_maps()
+        self.output_scale_maps = output_vectoriser.scale_maps()
+        self._conditions = {}
+        self._leaves = {}
+
+    def condition(self, condition_map):
+        key = condition_map.tobytes()
+        code = self._conditions.get(key)
+        if code is None:
+            code = self.input_vectoriser.to_expression(condition_map, self.input_scale_maps)
+            self._conditions[key] = code
+        return code
+
+    def leaf(self, linear_map):
+        """
+        A tuple of the (key, code) pairs of the outputs of a leaf, as from
+        Vectoriser.to_mapped_expressions.
+        """
+        key = linear_map.tobytes()
+        expressions = self._leaves.get(key)
+        if expressions is None:
+            expressions = tuple(
+                self.output_vectoriser.to_mapped_expressions(
+                    linear_map, self.input_vectoriser, self.output_scale_maps, self.input_scale_maps
+                )
+            )
+            self._leaves[key] = expressions
+        return expressions
+
+
+def write_function(file, root_node, expressions, function_name, args, indent=0, as_tuple=False, shared_leaves=False):
+    """
+    Writes the function function_name(args) for the tree under root_node. With shared_leaves the code of
+    each leaf that more than one leaf has (their maps can differ by less than the code shows) becomes a
+    function of its own, written first, that those leaves call.
+    """
+    leaf_functions = {}
+    if shared_leaves:
+        counts = {}
+        for node in _leaves(root_node):
+            key = expressions.leaf(node.linear_map)
+            counts[key] = counts.get(key, 0) + 1
+        for node in _leaves(root_node):
+            key = expressions.leaf(node.linear_map)
+            if counts[key] > 1 and key not in leaf_functions:
+                leaf_function = f"_{function_name}_leaf_{len(leaf_functions)}"
+                leaf_functions[key] = f"{leaf_function}({args})"
+                file.write("  " * indent + f"def {leaf_function}({args}):\n")
+                _write_leaf(file, node, expressions, indent + 1, as_tuple)
+    file.write("  " * indent + f"def {function_name}({args}):\n")
+    write_body(file, root_node, expressions, indent + 1, as_tuple, leaf_functions)
+
+
+def write_body(file, root_node, expressions, indent, as_tuple=False, leaf_functions=None):
+    """
+    Writes the if statements of the tree under root_node, working through the nodes with a stack rather
+    than recursion so deep trees don't run out of stack. leaf_functions maps the code of a leaf, from
+    ExpressionCache.leaf, to the call to return instead of writing out the leaf.
+    """
+    leaf_functions = leaf_functions or {}
+    # each item is a node to write at an indent, or a line that's already written out
+    pending = [(root_node, indent)]
+    while pending:
+        node, indent = pending.pop()
+        if isinstance(node, str):
+            file.write(node)
+        elif hasattr(node, "linear_map"):
+            call = leaf_functions.get(expressions.leaf(node.linear_map)) if leaf_functions else None
+            if call is None:
+                _write_leaf(file, node, expressions, indent, as_tuple)
+            else:
+                file.write("  " * indent + f"return {call}\n")
+        else:
+            file.write("  " * indent + f"if {expressions.condition(node.condition_map)}:\n")
+            pending.append((node.less, indent + 1))
+            pending.append(("  " * indent + "else:\n", indent))
+            pending.append((node.greater, indent + 1))
+
+
+def _write_leaf(file, node, expressions, indent, as_tuple):
+    output_expressions = expressions.leaf(node.linear_map)
+    if as_tuple:
+        output_expressions = dict(output_expressions)
+        lines = ["  " * indent + "return ("]
+        for var_name in expressions.output_vectoriser.keys():
+            lines.append("  " * (indent + 1) + f"{output_expressions[var_name]},")
+        lines.append("  " * indent + ")")
+    else:
+        lines = ["  " * indent + "return {"]
+        for var_name, expression in output_expressions:
+            lines.append("  " * (indent + 1) + f'"{var_name}": {expression},')
+        lines.append("  " * indent + "}")
+    file.write("\n".join(lines) + "\n")
+
+
+def _leaves(root_node):
+    # in the order write_body writes them, greater side first
+    pending = [root_node]
+    while pending:
+        node = pending.pop()
+        if hasattr(node, "linear_map"):
+            yield node
+        else:
+            pending.append(node.less)
+            pending.append(node.greater)
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+import numpy as np
+
+
+@dataclass
+class FlatTree:
+    """
+    A trained tree flattened into arrays, internal nodes numbered breadth first. greater[n] and less[n]
+    are internal nodes when non negative, and the leaf ~c when negative.
+    """
+
+    condition_maps: np.ndarray
+    greater: np.ndarray
+    less: np.ndarray
+    leaf_maps: np.ndarray
+
+    @classmethod
+    def from_node(cls, root_node):
+        condition_maps = []
+        children = []
+        leaf_maps = []
+        queue = [root_node]
+        # first pass gives every node its index, internal nodes count up from 0, leaves count down from -1
+        indices = {}
+        for node in queue:
+            if hasattr(node, "linear_map"):
+                indices[id(node)] = ~len(leaf_maps)
+                leaf_maps.append(node.linear_map)
+            else:
+                indices[id(node)] = len(condition_maps)
+                condition_maps.append(node.condition_map)
+                children.append((node.greater, node.less))
+                queue += [node.greater, node.less]
+        input_width = leaf_maps[0].shape[1]
+        return cls(
+            condition_maps=np.array(condition_maps).reshape(len(condition_maps), input_width),
+            greater=np.array([indices[id(greater)] for greater, _ in children], dtype=np.int64),
+            less=np.array([indices[id(less)] for _, less in children], dtype=np.int64),
+            leaf_maps=np.array(leaf_maps),
+        )
+
+    @property
+    def root(self):
+        return 0 if len(self.condition_maps) > 0 else -1
+
+    @property
+    def depth(self):
+        """
+        The number of nodes from the root to the deepest leaf, counting both, so a single leaf has depth 1.
+        """
+        depth, level = 1, [self.root]
+        while level := [child for node in level if node >= 0 for child in (self.greater[node], self.less[node])]:
+            depth += 1
+        return depth
+
+    def leaf_indices(self, inputs):
+        """
+        Routes every row of inputs through the tree one level at a time, returning the leaf each row
+        ends up in.
+        """
+        node = np.full(len(inputs), self.root, dtype=np.int64)
+        active = np.flatnonzero(node >= 0)
+        while len(active) > 0:
+            current = node[active]
+            goes_greater = np.einsum("ij,ij->i", inputs[active], self.condition_maps[current]) >= 0
+            node[active] = np.where(goes_greater, self.greater[current], self.less[current])
+            active = active[node[active] >= 0]
+        return ~node
+
+    def evaluate(self, inputs):
+        leaves = self.leaf_indices(inputs)
+        result = np.zeros((len(inputs), self.leaf_maps.shape[1]))
+        for leaf in np.unique(leaves):
+            rows = leaves == leaf
+            result[rows] = inputs[rows] @ self.leaf_maps[leaf].T
+        return result
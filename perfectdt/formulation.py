@@ -0,0 +1,271 @@
+import numpy as np
+
+# Constraint senses, numbered as pulp numbers them
+LE = -1
+GE = 1
+# Codes for the senses in MPS and LP files
+MPS_SENSES = {LE: "L", GE: "G", 0: "E"}
+LP_SENSES = {LE: "<=", GE: ">=", 0: "="}
+# Names are written to problem files with the characters LP files don't allow in them replaced
+NAME_CHARACTERS = str.maketrans({"-": "_", ":": ".", " ": "_"})
+# How many rows or columns are formatted at a time while writing a problem file
+WRITE_CHUNK = 1024
+# Terms per line in LP files, which some readers limit the length of
+LP_TERMS_PER_LINE = 8
+
+
+class Variable:
+    """
+    A column of a problem that is written to a file instead of solved by pulp, see
+    ConstraintMatrix.write_mps. Takes the same arguments as pulp.LpVariable so the nodes can be built
+    with either, and varValue is set from a solution file.
+    """
+
+    __slots__ = ["name", "lowBound", "upBound", "cat", "varValue"]
+
+    def __init__(self, name, lowBound=None, upBound=None, cat="Continuous"):
+        self.name = name
+        self.lowBound = lowBound
+        self.upBound = upBound
+        self.cat = cat
+        self.varValue = None
+
+
+def problem_name(name):
+    return name.translate(NAME_CHARACTERS)
+
+
+def read_solution(path):
+    """
+    Reads a solution file in the format CBC writes with -solution: a status line, then a line of
+    "index name value reduced_cost" for each column that isn't 0 (and each row, with printingOptions all).
+    Returns the value of each name in it. Raises ValueError if the solver didn't find a solution.
+    """
+    values = {}
+    with open(path) as file:
+        status = file.readline()
+        words = status.split()
+        # "Stopped on time - objective value ..." has the best solution found before the time limit
+        if not words or not (words[0] == "Optimal" or (words[0] == "Stopped" and "objective" in words)):
+            raise ValueError(f"The solution file has no solution: ({status.strip()})")
+        for line in file:
+            words = line.split()
+            if len(words) < 3:
+                continue
+            # infeasible values are marked with **
+            if words[0] == "**":
+                words = words[1:]
+            values[words[1]] = float(words[2])
+    return values
+
+
+class ConstraintMatrix:
+    """
+    Collects the constraints of a problem as blocks of sparse COO triplets, with row numbers local to
+    each block, to hand to pulp in one pass or write straight to an MPS or LP file.
+    """
+
+    def __init__(self):
+        self.variables = []
+        self.objective = {}
+        self.row_count = 0
+        self._column_ids = {}
+        self._rows = []
+        self._columns = []
+        self._values = []
+        self._senses = []
+        self._rhs = []
+
+    def add_variables(self, variables):
+        """
+        Returns the column index of each variable, adding columns for variables that haven't been seen
+        yet.
+        """
+        columns = np.empty(len(variables), dtype=np.int64)
+        for idx, var in enumerate(variables):
+            column = self._column_ids.get(id(var))
+            if column is None:
+                column = len(self.variables)
+                self._column_ids[id(var)] = column
+                self.variables.append(var)
+            columns[idx] = column
+        return columns
+
+    def add_block(self, rows, columns, values, senses, rhs):
+        rhs = np.asarray(rhs, dtype=float).ravel()
+        rows = np.concatenate([np.asarray(r).ravel() for r in rows])
+        self._rows.append(rows + self.row_count)
+        self._columns.append(np.concatenate([np.asarray(c).ravel() for c in columns]))
+        self._values.append(np.concatenate([np.asarray(v, dtype=float).ravel() for v in values]))
+        self._senses.append(np.broadcast_to(senses, rhs.shape).astype(np.int8))
+        self._rhs.append(rhs)
+        self.row_count += len(rhs)
+
+    @property
+    def nonzero_count(self):
+        return sum(len(values) for values in self._values)
+
+    def add_objective(self, columns, coefficients):
+        for column, coefficient in zip(columns.tolist(), np.broadcast_to(coefficients, columns.shape).tolist()):
+            self.objective[column] = self.objective.get(column, 0) + coefficient
+
+    def to_csr(self):
+        """
+        Returns (indptr, columns, values, senses, rhs) with the entries of row r in
+        columns[indptr[r]:indptr[r + 1]].
+        """
+        if self.row_count == 0:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), np.zeros(0)
+        rows = np.concatenate(self._rows)
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(self.row_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.row_count), out=indptr[1:])
+        return (
+            indptr,
+            np.concatenate(self._columns)[order],
+            np.concatenate(self._values)[order],
+            np.concatenate(self._senses),
+            np.concatenate(self._rhs),
+        )
+
+    def add_to_problem(self, problem):
+        import pulp
+
+        indptr, columns, values, senses, rhs = self.to_csr()
+        variables = self.variables
+        columns = columns.tolist()
+        values = values.tolist()
+        indptr = indptr.tolist()
+        for row, (sense, row_rhs) in enumerate(zip(senses.tolist(), rhs.tolist())):
+            start, end = indptr[row], indptr[row + 1]
+            expression = pulp.LpAffineExpression(
+                [(variables[column], value) for column, value in zip(columns[start:end], values[start:end])]
+            )
+            problem.addConstraint(pulp.LpConstraint(expression, sense, rhs=row_rhs))
+        if self.objective:
+            problem += pulp.LpAffineExpression(
+                [(variables[column], coefficient) for column, coefficient in self.objective.items()]
+            )
+
+    def to_csc(self):
+        """
+        Returns (indptr, rows, values) with the entries of column c in rows[indptr[c]:indptr[c + 1]].
+        """
+        if self.row_count == 0:
+            return np.zeros(len(self.variables) + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        columns = np.concatenate(self._columns)
+        order = np.argsort(columns, kind="stable")
+        indptr = np.zeros(len(self.variables) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=len(self.variables)), out=indptr[1:])
+        return indptr, np.concatenate(self._rows)[order], np.concatenate(self._values)[order]
+
+    def write_mps(self, path):
+        """
+        Writes the problem, minimising the objective, to path as a free format MPS file, a chunk of
+        columns at a time. Rows are named R0, R1, ... and columns by their variable's name, see
+        problem_name. The variables can be pulp variables or Variables.
+        """
+        senses = np.concatenate(self._senses) if self._senses else np.zeros(0, dtype=np.int8)
+        rhs = np.concatenate(self._rhs) if self._rhs else np.zeros(0)
+        indptr, rows, values = self.to_csc()
+        names = [problem_name(var.name) for var in self.variables]
+        with open(path, "w") as file:
+            file.write("NAME perfectdt\nROWS\n N OBJ\n")
+            for start in range(0, self.row_count, WRITE_CHUNK):
+                chunk = senses[start : start + WRITE_CHUNK].tolist()
+                file.writelines(f" {MPS_SENSES[sense]} R{start + idx}\n" for idx, sense in enumerate(chunk))
+            file.write("COLUMNS\n")
+            integer = False
+            for start in range(0, len(names), WRITE_CHUNK):
+                end = min(start + WRITE_CHUNK, len(names))
+                chunk_rows = rows[indptr[start] : indptr[end]].tolist()
+                chunk_values = values[indptr[start] : indptr[end]].tolist()
+                offsets = (indptr[start : end + 1] - indptr[start]).tolist()
+                lines = []
+                for column in range(start, end):
+                    is_integer = self.variables[column].cat == "Integer"
+                    if is_integer != integer:
+                        lines.append(f" MARKER 'MARKER' '{'INTORG' if is_integer else 'INTEND'}'\n")
+                        integer = is_integer
+                    name = names[column]
+                    entries = range(offsets[column - start], offsets[column - start + 1])
+                    lines.extend(f" {name} R{chunk_rows[entry]} {chunk_values[entry]!r}\n" for entry in entries)
+                    # a column has to appear here to exist, even if it's in no row and not in the objective
+                    if column in self.objective or not entries:
+                        lines.append(f" {name} OBJ {float(self.objective.get(column, 0))!r}\n")
+                file.writelines(lines)
+            if integer:
+                file.write(" MARKER 'MARKER' 'INTEND'\n")
+            file.write("RHS\n")
+            for start in range(0, self.row_count, WRITE_CHUNK):
+                chunk = rhs[start : start + WRITE_CHUNK].tolist()
+                file.writelines(f" RHS R{start + idx} {value!r}\n" for idx, value in enumerate(chunk) if value != 0)
+            file.write("BOUNDS\n")
+            for name, var in zip(names, self.variables):
+                file.writelines(_mps_bounds(name, var))
+            file.write("ENDATA\n")
+
+    def write_lp(self, path):
+        """
+        Writes the problem, minimising the objective, to path as a CPLEX LP file, a chunk of rows at a
+        time. Names are as in write_mps.
+        """
+        names = [problem_name(var.name) for var in self.variables]
+        indptr, columns, values, senses, rhs = self.to_csr()
+        with open(path, "w") as file:
+            file.write("\\ perfectdt\nMinimize\n")
+            objective = [(names[column], coefficient) for column, coefficient in self.objective.items()]
+            file.write(" OBJ:" + _lp_terms(objective or [(names[0], 0.0)] if names else []) + "\n")
+            file.write("Subject To\n")
+            for start in range(0, self.row_count, WRITE_CHUNK):
+                end = min(start + WRITE_CHUNK, self.row_count)
+                chunk_columns = columns[indptr[start] : indptr[end]].tolist()
+                chunk_values = values[indptr[start] : indptr[end]].tolist()
+                offsets = (indptr[start : end + 1] - indptr[start]).tolist()
+                lines = []
+                for row, sense, row_rhs in zip(range(start, end), senses[start:end].tolist(), rhs[start:end].tolist()):
+                    entries = range(offsets[row - start], offsets[row - start + 1])
+                    terms = [(names[chunk_columns[entry]], chunk_values[entry]) for entry in entries]
+                    terms = terms or [(names[0], 0.0)]
+                    lines.append(f" R{row}:{_lp_terms(terms)} {LP_SENSES[sense]} {row_rhs!r}\n")
+                file.writelines(lines)
+            file.write("Bounds\n")
+            for name, var in zip(names, self.variables):
+                file.write(_lp_bounds(name, var))
+            integers = [name for name, var in zip(names, self.variables) if var.cat == "Integer"]
+            if integers:
+                file.write("Generals\n")
+                for start in range(0, len(integers), LP_TERMS_PER_LINE):
+                    file.write(" " + " ".join(integers[start : start + LP_TERMS_PER_LINE]) + "\n")
+            file.write("End\n")
+
+
+def _mps_bounds(name, var):
+    low, up = var.lowBound, var.upBound
+    if var.cat == "Integer" and low == 0 and up == 1:
+        return [f" BV BND {name}\n"]
+    if low is None and up is None:
+        return [f" FR BND {name}\n"]
+    lines = [f" MI BND {name}\n" if low is None else f" LO BND {name} {float(low)!r}\n"]
+    if up is not None:
+        lines.append(f" UP BND {name} {float(up)!r}\n")
+    return lines
+
+
+def _lp_bounds(name, var):
+    low, up = var.lowBound, var.upBound
+    if low is None and up is None:
+        return f" {name} free\n"
+    low = "-inf" if low is None else repr(float(low))
+    up = "+inf" if up is None else repr(float(up))
+    return f" {low} <= {name} <= {up}\n"
+
+
+def _lp_terms(terms):
+    # LP files have a term's sign apart from its coefficient, and long rows split over several lines
+    text = []
+    for idx, (name, value) in enumerate(terms):
+        if idx and idx % LP_TERMS_PER_LINE == 0:
+            text.append("\n  ")
+        text.append(f" {'-' if value < 0 else '+'} {abs(value)!r} {name}")
+    return "".join(text)
@@ -0,0 +1,197 @@
+"""
+A greedy builder for trees that fit the vectorised training data, much faster than solving the MIP but
+usually deeper than the minimal tree.
+"""
+
+import itertools
+from types import SimpleNamespace
+import numpy as np
+from .flat_tree import FlatTree
+
+# How far off a row's vectorised output can be for a leaf to count as fitting it
+TOLERANCE = 1e-6
+# Thresholds tried along each split direction
+MAX_THRESHOLDS = 16
+# Rows closer than this (relative to the largest value) along a split direction aren't split apart
+SPLIT_GAP = 1e-9
+# Random rows whose neighbourhoods are tried as the rows a leaf fits, for oblique splits
+SEEDS = 8
+# The band conditions have to lie in for the tree to be a solution of the MIP, see
+# InternalNode.gather_constraints: map_sum is between 0 and BAND on the greater side and between -BAND
+# and -MARGIN on the less side.
+BAND = 2
+MARGIN = 0.1
+# With break_symmetry the rows on each side of a split are kept this far from 0 instead, and both sides
+# reach this much further out, so negating a condition always gives a valid twin and adding this to the
+# constant of any split the default band allows gives one this band allows.
+SYMMETRIC_MARGIN = 0.05
+
+
+def build_tree(inputs, outputs, max_depth=None, tolerance=0):
+    """
+    Greedily builds a tree that fits the vectorised inputs and outputs within tolerance, with least
+    squares leaves. Returns None if it would be deeper than max_depth or no leaf can fit some rows.
+    """
+
+    def build(rows, depth):
+        linear_map, residuals = _fit(inputs[rows], outputs[rows])
+        if np.all(np.abs(residuals) <= tolerance + TOLERANCE):
+            return SimpleNamespace(linear_map=linear_map)
+        if max_depth is not None and depth >= max_depth:
+            return None
+        split = _best_split(inputs[rows], outputs[rows])
+        if split is None:
+            return None
+        goes_greater = inputs[rows] @ split >= 0
+        greater = build(rows[goes_greater], depth + 1)
+        less = build(rows[~goes_greater], depth + 1)
+        if greater is None or less is None:
+            return None
+        return SimpleNamespace(
+            condition_map=_into_band(split, inputs, goes_greater, inputs[rows] @ split),
+            greater=greater,
+            less=less,
+        )
+
+    root = build(np.arange(len(inputs)), 1)
+    if root is None:
+        return None
+    tree = FlatTree.from_node(root)
+    # least squares leaves round off where coefficients should be 0, which the generated code would show
+    for maps in [tree.condition_maps, tree.leaf_maps]:
+        maps[np.abs(maps) < TOLERANCE] = 0
+    return tree
+
+
+def fits_formulation(tree, inputs, outputs, coefficient_bound=None, tolerance=0, break_symmetry=False):
+    """
+    Whether tree, as a MIP start, is a solution of the problem Model solves for inputs and outputs,
+    with the symmetric band and row limit when break_symmetry is set.
+    """
+    if coefficient_bound is not None:
+        if max(np.abs(tree.condition_maps).max(initial=0), np.abs(tree.leaf_maps).max()) > coefficient_bound:
+            return False
+    greater_margin, less_margin = (SYMMETRIC_MARGIN, SYMMETRIC_MARGIN) if break_symmetry else (0, MARGIN)
+    values = inputs @ tree.condition_maps.T
+    in_band = ((values >= greater_margin - TOLERANCE) & (values <= BAND + greater_margin + TOLERANCE)) | (
+        (values >= -BAND - greater_margin - TOLERANCE) & (values <= -less_margin + TOLERANCE)
+    )
+    if not in_band.all():
+        return False
+    goes_greater = values >= 0
+    if break_symmetry and np.any(2 * (~goes_greater).sum(axis=0) > len(inputs)):
+        return False
+    for leaf, path in _leaf_paths(tree):
+        mismatches = np.zeros(len(inputs))
+        for node, is_greater in path:
+            mismatches += goes_greater[:, node] != is_greater
+        residuals = np.abs(inputs @ tree.leaf_maps[leaf].T - outputs)
+        if np.any(residuals > BAND * mismatches[:, None] + tolerance + TOLERANCE):
+            return False
+    return True
+
+
+def _leaf_paths(tree):
+    pending = [(tree.root, ())]
+    while pending:
+        node, path = pending.pop()
+        if node < 0:
+            yield ~node, path
+        else:
+            pending.append((tree.greater[node], path + ((node, True),)))
+            pending.append((tree.less[node], path + ((node, False),)))
+
+
+def _fit(inputs, outputs):
+    coefficients = np.linalg.lstsq(inputs, outputs, rcond=None)[0]
+    return coefficients.T, outputs - inputs @ coefficients
+
+
+def _squared_error(inputs, outputs):
+    return (_fit(inputs, outputs)[1] ** 2).sum()
+
+
+def _best_split(inputs, outputs):
+    """
+    The split, as a vector v sending the rows with inputs @ v >= 0 to the greater side, that leaves the
+    least squared error in the least squares fits to the two sides. None when every row has the same
+    inputs.
+    """
+    best_error, best_split = np.inf, None
+    for direction in _directions(inputs, outputs):
+        projection = inputs @ direction
+        values = np.unique(projection)
+        # only split between values that differ by more than round off
+        gaps = np.diff(values) > SPLIT_GAP * max(1, np.abs(values).max())
+        thresholds = ((values[1:] + values[:-1]) / 2)[gaps]
+        if len(thresholds) > MAX_THRESHOLDS:
+            thresholds = thresholds[np.unique(np.linspace(0, len(thresholds) - 1, MAX_THRESHOLDS).round().astype(int))]
+        for threshold in thresholds.tolist():
+            goes_greater = projection >= threshold
+            error = _squared_error(inputs[goes_greater], outputs[goes_greater]) + _squared_error(
+                inputs[~goes_greater], outputs[~goes_greater]
+            )
+            if error < best_error:
+                best_error = error
+                best_split = direction.copy()
+                best_split[-1] -= threshold
+    return best_split
+
+
+def _directions(inputs, outputs):
+    """
+    Each column, then for the rows nearest each of a few rows, the least squares separation of the rows
+    that the map fitted to those rows fits from the rest.
+    """
+    input_length, input_width = inputs.shape
+    columns = [column for column in range(input_width - 1) if np.ptp(inputs[:, column]) > 0]
+    for column in columns:
+        direction = np.zeros(input_width)
+        direction[column] = 1
+        yield direction
+    # and comparisons between pairs of columns
+    for first, second in itertools.combinations(columns, 2):
+        for sign in [1, -1]:
+            direction = np.zeros(input_width)
+            direction[first], direction[second] = 1, sign
+            yield direction
+    # rows at both ends of each column, where a region is least likely to be cut through by others
+    centres = {row for column in columns for row in [inputs[:, column].argmin(), inputs[:, column].argmax()]}
+    centres.update(np.random.default_rng(0).choice(input_length, min(SEEDS, input_length), replace=False).tolist())
+    neighbourhood_size = min(input_width + 1, input_length)
+    separations = set()
+    for centre in sorted(centres):
+        distances = np.abs(inputs - inputs[centre]).sum(axis=1)
+        neighbourhood = np.argsort(distances, kind="stable")[:neighbourhood_size]
+        linear_map, residuals = _fit(inputs[neighbourhood], outputs[neighbourhood])
+        if np.abs(residuals).max() > TOLERANCE:
+            continue
+        fitted = np.all(np.abs(inputs @ linear_map.T - outputs) <= TOLERANCE, axis=1)
+        if fitted.all() or fitted.tobytes() in separations:
+            continue
+        separations.add(fitted.tobytes())
+        yield np.linalg.lstsq(inputs, np.where(fitted, 1.0, -1.0), rcond=None)[0]
+
+
+def _into_band(split, all_inputs, goes_greater, projection):
+    """
+    Scales and shifts split so the rows it was chosen on still go the same way, with the less side at or
+    below -MARGIN, and every row within the band if that can be done.
+    """
+    highest_less = projection[~goes_greater].max()
+    lowest_greater = projection[goes_greater].min()
+    values = all_inputs @ split
+    # put the less side's highest row at -MARGIN and scale as far as the band allows, leaving the
+    # greater side's lowest row as far above 0 as possible
+    with np.errstate(divide="ignore"):
+        scale = 0.99 * min(
+            (BAND + MARGIN) / (values.max() - highest_less),
+            (BAND - MARGIN) / (highest_less - values.min()),
+        )
+    if not scale * (lowest_greater - highest_less) > MARGIN:
+        # too close together for the band, split half way between the two sides instead
+        scale = 2 * MARGIN / (lowest_greater - highest_less)
+    offset = highest_less + MARGIN / scale
+    condition = scale * split
+    condition[-1] -= scale * offset
+    return condition
@@ -0,0 +1,52 @@
+"""
+Predicting with a trained tree, for processes that only ever predict. Nothing here imports the solver
+stack, only numpy.
+"""
+
+from dataclasses import dataclass
+import numpy as np
+from . import storage
+from .flat_tree import FlatTree
+from .vectoriser import Vectoriser
+
+
+@dataclass(frozen=True)
+class Predictor:
+    """
+    A trained tree and the vectorisers around it. Get one from Model.predictor() or load one from a file
+    written by Model.save.
+    """
+
+    input_vectoriser: Vectoriser
+    output_vectoriser: Vectoriser
+    tree: FlatTree
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a file written by Model.save, with mmap memory mapping the tree's arrays as Model.load does.
+        """
+        metadata, arrays = storage.read(path, mmap=mmap)
+        return cls(
+            Vectoriser.from_dict(metadata["input_vectoriser"]),
+            Vectoriser.from_dict(metadata["output_vectoriser"]),
+            FlatTree(**arrays),
+        )
+
+    def predict(self, inputs):
+        vector = self.input_vectoriser.to_vector(inputs)
+        node = self.tree.root
+        while node >= 0:
+            if self.tree.condition_maps[node] @ vector >= 0:
+                node = self.tree.greater[node]
+            else:
+                node = self.tree.less[node]
+        return self.output_vectoriser.from_vector(self.tree.leaf_maps[~node] @ vector)
+
+    def predict_batch(self, inputs, as_matrix=False):
+        """
+        Works like Model.predict_batch.
+        """
+        if not isinstance(inputs, np.ndarray):
+            inputs = self.input_vectoriser.to_vectors(inputs)
+        return self.output_vectoriser.from_vectors(self.tree.evaluate(inputs), as_matrix=as_matrix)
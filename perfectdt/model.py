@@ -1,26 +1,375 @@
+from collections.abc import Mapping
+import contextlib
 from dataclasses import dataclass
+import io
+import itertools
+import os
+import time
 import numpy as np
 from typing import Optional, Union
-import pulp
-from .vectoriser import Vectoriser
+from . import storage
+from .codegen import ExpressionCache, write_body, write_function
+from .flat_tree import FlatTree
+from .formulation import GE, LE, ConstraintMatrix, Variable, problem_name, read_solution
+from .heuristic import SYMMETRIC_MARGIN, build_tree, fits_formulation
+from .inference import Predictor
+from .python_expressions import to_numpy_condition, to_numpy_expression
+from .report import DepthAttempt, FitReport, deep_size
+from .solver import FEASIBLE, UNDECIDED, SolverConfig, SolverTimeout, solver_status
+from .vectoriser import Vectoriser, get_row
+
+DEPTH_SEARCHES = ["linear", "galloping", "binary"]
+MODES = ["exact", "heuristic", "seeded"]
+RESIDUALS = [None, "max", "total"]
+# How much a unit of residual costs in the objective against a unit of the l1 regulariser, which then
+# only chooses between trees with the same residual.
+RESIDUAL_WEIGHT = 1000
+# How far off a row's vectorised output can be before lazy_rows counts the tree as getting it wrong.
+ROW_TOLERANCE = 1e-6
+# What freeze drops besides the pulp variables in the nodes
+FROZEN_ATTRIBUTES = ["trained_inputs", "trained_outputs", "active_rows", "_incumbent"]
 
 
 class Model:
-    def fit(self, inputs, outputs, regularise="l1"):
+    def __init__(self, hooks=None):
+        """
+        hooks are called as hook(event, data) with ("phase", {"name", "seconds", "depth"}),
+        ("attempt", DepthAttempt) after each solve and ("fit", FitReport) at the end of fit.
+        """
+        self.hooks = list(hooks or [])
+        self.output_models = None
+
+    def fit(
+        self,
+        inputs,
+        outputs,
+        regularise="l1",
+        depth_search="linear",
+        min_depth=1,
+        max_depth=None,
+        n_jobs=1,
+        break_symmetry=False,
+        lazy_rows=None,
+        coefficient_bound=None,
+        solver=None,
+        freeze=True,
+        cache=None,
+        per_output=False,
+        mode="exact",
+        tolerance=None,
+        residual=None,
+        solve=True,
+    ):
+        """
+        inputs and outputs are lists of dicts, dicts of columns, or other iterables of rows (read into a list).
+          - depth_search: "linear", "galloping" (doubling, then bisecting) or "binary" (needs max_depth).
+          - n_jobs: depths solved at once in separate processes, -1 for one per CPU.
+          - break_symmetry: only allow the twin of each split with at most half the rows on its less side.
+          - lazy_rows: solve on that many rows, adding rows the tree gets wrong until it fits them all.
+          - coefficient_bound: bound on every vectorised map coefficient, which tightens the big-Ms.
+          - solver: a SolverConfig. freeze: freeze once fitted. cache: a ModelCache of solved depths.
+          - per_output: a tree for each output key, kept in output_models.
+          - mode: "exact", "heuristic" (a greedy tree) or "seeded" (the greedy tree bounds the exact search).
+          - tolerance: how far each output may be off, a number or a dict by output key.
+          - residual: "max" or "total" error to minimise at max_depth instead of fitting exactly.
+          - solve: with False only vectorise and record the settings, see export_problem.
+        """
+        if depth_search not in DEPTH_SEARCHES:
+            raise ValueError(f"Unknown depth search: ({depth_search})")
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: ({mode})")
+        if residual not in RESIDUALS:
+            raise ValueError(f"Unknown residual: ({residual})")
+        if residual is not None and max_depth is None:
+            raise ValueError("Minimising the residual needs a max_depth")
+        if residual is not None and lazy_rows is not None:
+            raise ValueError("lazy_rows can't be used while minimising the residual")
+        if depth_search == "binary" and max_depth is None and mode != "seeded":
+            raise ValueError("A binary depth search needs a max_depth")
+        if per_output and not solve:
+            raise ValueError("A model fitted per_output can't be fitted without solving")
+        # the rows are read more than once, to fit the vectorisers and then to vectorise them
+        if not isinstance(inputs, (list, Mapping)):
+            inputs = list(inputs)
+        if not isinstance(outputs, (list, Mapping)):
+            outputs = list(outputs)
         self.regularise = regularise
-        self._vectorise_data(inputs, outputs)
-        self._train_model()
+        self.mode = mode
+        self.tolerance = tolerance
+        self.residual = residual
+        self.depth_search = depth_search
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.break_symmetry = break_symmetry
+        self.lazy_rows = lazy_rows
+        self.coefficient_bound = coefficient_bound
+        self.solver = SolverConfig() if solver is None else solver
+        self.cache = cache
+        self.fit_report = FitReport()
+        self.output_models = None
+        if per_output:
+            settings = {
+                "regularise": regularise,
+                "depth_search": depth_search,
+                "min_depth": min_depth,
+                "max_depth": max_depth,
+                "break_symmetry": break_symmetry,
+                "lazy_rows": lazy_rows,
+                "coefficient_bound": coefficient_bound,
+                "solver": self.solver,
+                "freeze": freeze,
+                "cache": cache,
+                "mode": mode,
+                "tolerance": tolerance,
+                "residual": residual,
+            }
+            self._train_output_models(inputs, outputs, settings)
+        else:
+            self._vectorise_data(inputs, outputs)
+            if solve:
+                with self._phase("train"):
+                    self._train_model()
+        self.fit_report.record_peak_memory()
+        if freeze and solve:
+            self.freeze()
+        self._emit("fit", self.fit_report)
+
+    def export_problem(self, path, depth):
+        """
+        Writes the problem for a tree of depth depth to path as MPS, or LP if path ends in .lp, using the
+        settings and data of the last fit (which can be fit(solve=False)). See import_solution.
+        """
+        self._check_single_tree("export_problem")
+        if getattr(self, "trained_inputs", None) is None:
+            raise ValueError("Exporting a problem needs a model fitted with freeze=False or solve=False")
+        _, matrix = self._gather_matrix(depth, None, None, Variable)
+        if str(path).endswith(".lp"):
+            matrix.write_lp(path)
+        else:
+            matrix.write_mps(path)
+
+    def import_solution(self, path, depth):
+        """
+        Makes the tree in the CBC solution file at path, for the problem export_problem wrote for depth,
+        the model's tree and returns it as a FlatTree.
+        """
+        self._check_single_tree("import_solution")
+        if getattr(self, "trained_inputs", None) is None:
+            raise ValueError("Importing a solution needs a model fitted with freeze=False or solve=False")
+        values = read_solution(path)
+
+        def variable(name, **bounds):
+            var = Variable(name, **bounds)
+            # solution files leave out the columns that are 0
+            var.varValue = values.get(problem_name(name), 0.0)
+            return var
+
+        self.root_node = self._build_tree(depth, "root", 0, variable)
+        self.root_node.make_maps()
+        self.depth = depth
+        self._flat_tree = None
+        self._compiled = {}
+        return self.flat_tree
+
+    def freeze(self):
+        """
+        Drops the training data and pulp variables, leaving read only nodes that can still predict, generate
+        code and be saved. Returns an estimate of the bytes freed, also kept as fit_report.freed_memory.
+        """
+        if self.output_models is not None:
+            freed_memory = sum(model.freeze() for model in self.output_models.values())
+            self.fit_report.freed_memory = freed_memory
+            return freed_memory
+        tree = self.flat_tree
+        for array in [tree.condition_maps, tree.greater, tree.less, tree.leaf_maps]:
+            array.flags.writeable = False
+        training_state = [getattr(self, name, None) for name in FROZEN_ATTRIBUTES]
+        before = deep_size(self.root_node, tree, *training_state)
+        self.root_node = _frozen_nodes(tree, tree.root)
+        for name in FROZEN_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        freed_memory = before - deep_size(self.root_node, tree)
+        if getattr(self, "fit_report", None) is not None:
+            self.fit_report.freed_memory = freed_memory
+        return freed_memory
+
+    def partial_fit(self, inputs, outputs, freeze=False):
+        """
+        Adds rows to a model fitted with freeze=False, solving again from the current depth and tree only
+        if the tree gets a new row wrong. Returns True when it solved again.
+        """
+        self._check_single_tree("partial_fit")
+        if getattr(self, "trained_inputs", None) is None:
+            raise ValueError("partial_fit needs a model fitted with freeze=False")
+        self.fit_report = FitReport()
+        old_input_vectoriser, old_output_vectoriser = self.input_vectoriser, self.output_vectoriser
+        with self._phase("fit_vectorisers"):
+            self.input_vectoriser = old_input_vectoriser.extended(inputs)
+            self.output_vectoriser = old_output_vectoriser.extended(outputs)
+        with self._phase("to_vectors"):
+            new_inputs = self.input_vectoriser.to_vectors(inputs)
+            new_outputs = self.output_vectoriser.to_vectors(outputs)
+            trained_inputs = self.input_vectoriser.convert_vectors(self.trained_inputs, old_input_vectoriser)
+            trained_outputs = self.output_vectoriser.convert_vectors(self.trained_outputs, old_output_vectoriser)
+            old_tree = self.flat_tree
+            vector_map = self.input_vectoriser.vector_map_from(old_input_vectoriser)
+            tree = FlatTree(
+                condition_maps=old_tree.condition_maps @ vector_map,
+                greater=old_tree.greater,
+                less=old_tree.less,
+                leaf_maps=self.output_vectoriser.convert_maps(old_tree.leaf_maps, old_output_vectoriser) @ vector_map,
+            )
+        with self._phase("deduplicate"):
+            self._deduplicate(
+                None, None, np.concatenate([trained_inputs, new_inputs]), np.concatenate([trained_outputs, new_outputs])
+            )
+
+        self._compiled = {}
+        residuals = np.abs(tree.evaluate(new_inputs) - new_outputs)
+        refit = bool(np.any(residuals > self._output_tolerance() + ROW_TOLERANCE))
+        if refit:
+            # more rows never make a shallower tree fit
+            self.min_depth = max(self.min_depth, self.depth)
+            with self._phase("train"):
+                self._train_model(incumbent=tree)
+        else:
+            self._flat_tree = tree
+            self.root_node = _frozen_nodes(tree, tree.root)
+        self.fit_report.record_peak_memory()
+        if freeze:
+            self.freeze()
+        self._emit("fit", self.fit_report)
+        return refit
+
+    def _train_output_models(self, inputs, outputs, settings):
+        self.input_vectoriser = Vectoriser()
+        self.output_vectoriser = Vectoriser(include_constant=False)
+        with self._phase("fit_vectorisers"):
+            self.input_vectoriser.fit(inputs)
+            self.output_vectoriser.fit(outputs)
+        keys = self.output_vectoriser.keys()
+        jobs = [(Model(), inputs, _output_column(outputs, key), _output_settings(settings, key)) for key in keys]
+        with self._phase("train"):
+            if self.n_jobs > 1 and len(jobs) > 1:
+                from .parallel import fit_models_in_parallel
+
+                models = fit_models_in_parallel(jobs, self.n_jobs)
+            else:
+                models = [model for model, *_ in jobs]
+                for model, _, key_outputs, key_settings in jobs:
+                    model.fit(inputs, key_outputs, **key_settings)
+        for model in models:
+            for attempt in model.fit_report.attempts:
+                self.fit_report.attempts.append(attempt)
+                for name, seconds in attempt.phases.items():
+                    self.fit_report.add_phase(name, seconds)
+                self._emit("attempt", attempt)
+        self.output_models = dict(zip(keys, models))
+        self.depth = max(model.depth for model in models)
+        self._compiled = {}
+
+    def _check_single_tree(self, action):
+        if self.output_models is not None:
+            raise ValueError(f"A model fitted per_output has no single tree: ({action})")
+
+    def _emit(self, event, data):
+        for hook in self.hooks:
+            hook(event, data)
+
+    @contextlib.contextmanager
+    def _phase(self, name, attempt=None):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.fit_report.add_phase(name, seconds, attempt)
+        self._emit("phase", {"name": name, "seconds": seconds, "depth": None if attempt is None else attempt.depth})
 
     def _vectorise_data(self, inputs, outputs):
         self.input_vectoriser = Vectoriser()
         self.output_vectoriser = Vectoriser(include_constant=False)
-        self.input_vectoriser.fit(inputs)
-        self.output_vectoriser.fit(outputs)
-        self.trained_inputs = self.input_vectoriser.to_vectors(inputs)
-        self.trained_outputs = self.output_vectoriser.to_vectors(outputs)
+        with self._phase("fit_vectorisers"):
+            self.input_vectoriser.fit(inputs)
+            self.output_vectoriser.fit(outputs)
+        with self._phase("to_vectors"):
+            trained_inputs = self.input_vectoriser.to_vectors(inputs)
+            trained_outputs = self.output_vectoriser.to_vectors(outputs)
+        with self._phase("deduplicate"):
+            self._deduplicate(inputs, outputs, trained_inputs, trained_outputs)
+
+    def _deduplicate(self, inputs, outputs, trained_inputs, trained_outputs):
+        # Rows with identical inputs add variables and constraints to the problem but nothing else, so
+        # only the first of each is kept. If they disagree on the output (by more than the tolerance
+        # either side of one value) no tree can fit them, unless the residual is being minimised. inputs
+        # and outputs are only used to describe conflicting rows, without them the vectors are converted
+        # back.
+        tolerance = self._output_tolerance()
+        keep_outputs = tolerance.any() or getattr(self, "residual", None) is not None
+        _, first_rows, inverse = np.unique(trained_inputs, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        first_row = first_rows[inverse]
+        differs = np.any(trained_outputs != trained_outputs[first_row], axis=1)
+        if tolerance.any():
+            highest = np.full((len(first_rows), trained_outputs.shape[1]), -np.inf)
+            lowest = np.full(highest.shape, np.inf)
+            np.maximum.at(highest, inverse, trained_outputs)
+            np.minimum.at(lowest, inverse, trained_outputs)
+            differs &= np.any(highest - lowest > 2 * tolerance + ROW_TOLERANCE, axis=1)[inverse]
+        if getattr(self, "residual", None) is not None:
+            differs[:] = False
+        conflicts = np.flatnonzero(differs)
+        if len(conflicts) > 0:
+            groups = {}
+            for row in conflicts.tolist():
+                groups.setdefault(first_row[row], [first_row[row]]).append(row)
+
+            def describe(data, vectoriser, vectors, row):
+                return vectoriser.from_vector(vectors[row]) if data is None else get_row(data, row)
+
+            descriptions = []
+            for rows in list(groups.values())[:10]:
+                row_inputs = describe(inputs, self.input_vectoriser, trained_inputs, rows[0])
+                row_outputs = [describe(outputs, self.output_vectoriser, trained_outputs, row) for row in rows]
+                descriptions.append(f"rows {rows} have inputs {row_inputs} but outputs {row_outputs}")
+            raise ValueError(
+                f"{len(groups)} sets of rows have the same inputs but different outputs:\n" + "\n".join(descriptions)
+            )
+        if keep_outputs:
+            # rows with the same inputs but different outputs all count towards the fit
+            _, keep = np.unique(np.hstack([trained_inputs, trained_outputs]), axis=0, return_index=True)
+        else:
+            keep = first_rows
+        keep = np.sort(keep)
+        self.trained_inputs = trained_inputs[keep]
+        self.trained_outputs = trained_outputs[keep]
+        self.compression_ratio = len(trained_inputs) / len(keep) if len(keep) else 1.0
+        self.fit_report.input_rows = len(trained_inputs)
+        self.fit_report.unique_rows = len(keep)
+
+    def _output_tolerance(self):
+        """
+        tolerance in the units of the vectorised outputs, a value for each column.
+        """
+        result = np.zeros(self.output_vectoriser.width)
+        tolerance = getattr(self, "tolerance", None)
+        if tolerance is None:
+            return result
+        if isinstance(tolerance, Mapping):
+            unknown = set(tolerance) - set(self.output_vectoriser.keys())
+            if unknown:
+                raise ValueError(f"Tolerance given for keys that aren't outputs: ({sorted(unknown)})")
+        for key, idx in self.output_vectoriser.float_keys.items():
+            key_tolerance = tolerance.get(key, 0) if isinstance(tolerance, Mapping) else tolerance
+            a, _ = self.output_vectoriser._forward_scale_map(key)
+            result[idx] = abs(a) * key_tolerance
+        return result
 
     def predict(self, inputs):
-        result = []
+        if self.output_models is not None:
+            result = {}
+            for model in self.output_models.values():
+                result.update(model.predict(inputs))
+            return result
         inputs = self.input_vectoriser.to_vector(inputs)
         node = self.root_node
         while getattr(node, "linear_map", None) is None:
@@ -30,118 +379,602 @@ class Model:
                 node = node.less
         return self.output_vectoriser.from_vector(node.linear_map @ inputs)
 
-    def _train_model(self):
-        depth = 1
-        while not self._train_model_at_depth(depth):
-            depth += 1
+    def predict_batch(self, inputs, as_matrix=False):
+        """
+        Predicts many rows, given as a list of dicts, a dict of columns or already vectorised. Returns a
+        list of dicts, or with as_matrix a matrix with a column per output_vectoriser.keys() and nan for None.
+        """
+        if not isinstance(inputs, np.ndarray):
+            inputs = self.input_vectoriser.to_vectors(inputs)
+        if self.output_models is not None:
+            # the output models' input vectorisers were fitted to the same rows as this one, so they
+            # all vectorise the same way
+            results = [model.predict_batch(inputs, as_matrix=as_matrix) for model in self.output_models.values()]
+            if as_matrix:
+                return np.hstack(results)
+            return [{key: value for row in rows for key, value in row.items()} for rows in zip(*results)]
+        outputs = self.flat_tree.evaluate(inputs)
+        return self.output_vectoriser.from_vectors(outputs, as_matrix=as_matrix)
+
+    def predictor(self):
+        """
+        A Predictor for the trained tree, which predicts without the training data or the solver.
+        """
+        self._check_single_tree("predictor")
+        return Predictor(self.input_vectoriser, self.output_vectoriser, self.flat_tree)
+
+    def save(self, path):
+        """
+        Saves the trained tree and vectorisers to path in the format of perfectdt.storage. The training
+        data and solver state are left behind, load the model again with Model.load.
+        """
+        self._check_single_tree("save")
+        tree = self.flat_tree
+        storage.write(
+            path,
+            {
+                "depth": self.depth,
+                "input_vectoriser": self.input_vectoriser.to_dict(),
+                "output_vectoriser": self.output_vectoriser.to_dict(),
+            },
+            {
+                "condition_maps": tree.condition_maps,
+                "greater": tree.greater,
+                "less": tree.less,
+                "leaf_maps": tree.leaf_maps,
+            },
+        )
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a model written by save, ready to predict and generate code but not to train. With mmap the
+        tree's arrays are memory mapped read only from the file.
+        """
+        metadata, arrays = storage.read(path, mmap=mmap)
+        model = cls()
+        model.depth = metadata["depth"]
+        model.input_vectoriser = Vectoriser.from_dict(metadata["input_vectoriser"])
+        model.output_vectoriser = Vectoriser.from_dict(metadata["output_vectoriser"])
+        model._flat_tree = FlatTree(**arrays)
+        model._compiled = {}
+        model.root_node = _frozen_nodes(model._flat_tree, model._flat_tree.root)
+        return model
+
+    @property
+    def flat_tree(self):
+        self._check_single_tree("flat_tree")
+        if getattr(self, "_flat_tree", None) is None:
+            self._flat_tree = FlatTree.from_node(self.root_node)
+        return self._flat_tree
+
+    def _train_model(self, incumbent=None):
+        self._incumbent = incumbent
+        self.depth = None
+        self.undecided_depths = []
+        total_time_limit = self.solver.total_time_limit
+        self._deadline = None if total_time_limit is None else time.monotonic() + total_time_limit
+        self._cache_key = None if self.cache is None else self.cache.key(self)
+        # minimising the residual makes every depth feasible, so only max_depth is solved
+        min_depth = self.min_depth if self.residual is None else self.max_depth
+        max_depth = self.max_depth
+        if self.mode != "exact":
+            with self._phase("heuristic"):
+                tree = build_tree(self.trained_inputs, self.trained_outputs, self.max_depth, self._output_tolerance())
+            if self.mode == "heuristic":
+                if tree is None:
+                    raise ValueError(f"The heuristic found no tree that fits the data, max_depth: ({self.max_depth})")
+                self.depth = tree.depth
+                self._flat_tree = tree
+                self.root_node = _frozen_nodes(tree, tree.root)
+                self._compiled = {}
+                return
+            if tree is not None and fits_formulation(
+                tree,
+                self.trained_inputs,
+                self.trained_outputs,
+                self.coefficient_bound,
+                self._output_tolerance(),
+                self.break_symmetry,
+            ):
+                # the tree is a solution of the MIP at its depth, so no deeper depth needs trying
+                bound = max(min_depth, tree.depth)
+                max_depth = bound if max_depth is None else min(max_depth, bound)
+                if self._incumbent is None:
+                    self._incumbent = tree
+            if self.depth_search == "binary" and max_depth is None:
+                raise ValueError("A binary depth search needs a max_depth, and the heuristic tree can't be used")
+        input_length = len(self.trained_inputs)
+        if self.lazy_rows is None or self.lazy_rows >= input_length:
+            self.active_rows = np.arange(input_length)
+        else:
+            self.active_rows = np.sort(np.random.default_rng(0).choice(input_length, self.lazy_rows, replace=False))
+        if self.n_jobs > 1:
+            from .parallel import solve_depths_in_parallel
+
+            outcomes, result, attempts = solve_depths_in_parallel(
+                self._solver_copy(), self.n_jobs, min_depth, max_depth, self.solver.on_timeout == "raise"
+            )
+            for attempt in attempts:
+                self.fit_report.attempts.append(attempt)
+                for name, seconds in attempt.phases.items():
+                    self.fit_report.add_phase(name, seconds)
+                self._emit("attempt", attempt)
+            self.undecided_depths = sorted(depth for depth, outcome in outcomes.items() if outcome == UNDECIDED)
+            if result is not None:
+                self.depth, self._incumbent = result
+                self.root_node = _frozen_nodes(self._incumbent, self._incumbent.root)
+        else:
+            self._search_depths(min_depth, max_depth)
+        if self.depth is None:
+            if self.undecided_depths:
+                raise SolverTimeout(f"Depths {self.undecided_depths} were neither solved nor proven infeasible")
+            raise ValueError(f"No tree with a depth of at most {self.max_depth} fits the data")
+        self._flat_tree = None
+        self._compiled = {}
+
+    def _search_depths(self, min_depth, max_depth):
+        solved_root = None
+
+        def try_depth(depth):
+            nonlocal solved_root
+            outcome = self._train_model_at_depth(depth)
+            if outcome == FEASIBLE:
+                solved_root = self.root_node
+                self.depth = depth
+                self._incumbent = self.flat_tree
+                return True
+            if outcome == UNDECIDED:
+                self.undecided_depths.append(depth)
+                if self.solver.on_timeout == "raise" or self._time_left() == 0:
+                    raise SolverTimeout(f"Depth {depth} was neither solved nor proven infeasible")
+            return False
+
+        # every depth above a feasible depth is feasible too, so the searches only need to keep track of
+        # the deepest depth known not to fit and the shallowest depth known to fit.
+        try:
+            if self.depth_search == "binary":
+                infeasible, feasible = min_depth - 1, max_depth
+                if not try_depth(feasible):
+                    return
+            else:
+                infeasible, depth, step = min_depth - 1, min_depth, 1
+                while max_depth is None or depth <= max_depth:
+                    if try_depth(depth):
+                        break
+                    infeasible = depth
+                    if self.depth_search == "galloping":
+                        depth = depth + step if max_depth is None else min(depth + step, max_depth)
+                        step *= 2
+                    else:
+                        depth += 1
+                    if depth == infeasible:
+                        break
+                if self.depth is None:
+                    return
+                feasible = self.depth
+
+            while feasible - infeasible > 1:
+                depth = (infeasible + feasible) // 2
+                if try_depth(depth):
+                    feasible = depth
+                else:
+                    infeasible = depth
+        except SolverTimeout:
+            if solved_root is None:
+                raise
+        self.root_node = solved_root
+
+    def _time_left(self):
+        if self._deadline is None:
+            return None
+        return max(0, self._deadline - time.monotonic())
+
+    def _solver_copy(self):
+        """
+        A copy of the model with only what is needed to solve it, for sending to another process.
+        """
+        copy = Model()
+        skip = {"root_node", "_flat_tree", "_compiled", "hooks"}
+        copy.__dict__.update((key, value) for key, value in self.__dict__.items() if key not in skip)
+        return copy
+
+    def _make_problem(self, depth, rows=None, attempt=None):
+        # pulp is only imported once there's something to solve, so predicting doesn't pay for it
+        import pulp
 
-    def _make_problem(self, depth):
         problem = pulp.LpProblem()
-        self.root_node = self._build_tree(depth, "root")
-        self.root_node.gather_constraints(problem, self.trained_inputs, self.trained_outputs)
-        if self.regularise == "l1":
-            constraints, objective = self.root_node.gather_objective()
-            for constraint in constraints:
-                problem += constraint
-            problem += objective
+        self.root_node, matrix = self._gather_matrix(depth, rows, attempt, pulp.LpVariable)
+        with self._phase("add_to_problem", attempt):
+            matrix.add_to_problem(problem)
+        if attempt is not None:
+            attempt.variables = len(matrix.variables)
+            attempt.constraints = matrix.row_count
+            attempt.nonzeros = matrix.nonzero_count
         return problem
 
+    def _gather_matrix(self, depth, rows, attempt, variable):
+        """
+        Returns the root node of a tree of depth depth and the ConstraintMatrix of its problem, with
+        variables made by calling variable like pulp.LpVariable.
+        """
+        inputs = self.trained_inputs if rows is None else self.trained_inputs[rows]
+        outputs = self.trained_outputs if rows is None else self.trained_outputs[rows]
+        with self._phase("build_tree", attempt):
+            root_node = self._build_tree(depth, "root", len(inputs), variable)
+        matrix = ConstraintMatrix()
+        residual_columns = None
+        if self.residual == "max":
+            residual_columns = matrix.add_variables([variable("residual", lowBound=0)])
+            residual_columns = np.broadcast_to(residual_columns, outputs.shape)
+        elif self.residual == "total":
+            residual_variables = [
+                variable(f"residual({i}:{j})", lowBound=0)
+                for i in range(outputs.shape[0])
+                for j in range(outputs.shape[1])
+            ]
+            residual_columns = matrix.add_variables(residual_variables).reshape(outputs.shape)
+        if residual_columns is not None:
+            matrix.add_objective(np.unique(residual_columns), RESIDUAL_WEIGHT)
+        with self._phase("gather_constraints", attempt):
+            root_node.gather_constraints(
+                matrix,
+                inputs,
+                outputs,
+                break_symmetry=self.break_symmetry,
+                coefficient_bound=self.coefficient_bound,
+                tolerance=self._output_tolerance(),
+                residual_columns=residual_columns,
+            )
+        if self.regularise == "l1":
+            with self._phase("gather_objective", attempt):
+                root_node.gather_objective(matrix, variable)
+        return root_node, matrix
+
     def _train_model_at_depth(self, depth):
-        problem = self._make_problem(depth)
-        if problem.solve() > 0:
-            self.root_node.make_maps()
-            return True
-        return False
+        if self.cache is None:
+            return self._solve_rows_at_depth(depth)
+        cached = self.cache.lookup(self._cache_key, depth)
+        if cached is not None:
+            attempt = DepthAttempt(depth=depth, rows=len(self.trained_inputs), solver_status="cached")
+            attempt.outcome, tree = cached
+            self.fit_report.attempts.append(attempt)
+            if tree is not None:
+                self._flat_tree = tree
+                self.root_node = _frozen_nodes(tree, tree.root)
+                self._compiled = {}
+            self._emit("attempt", attempt)
+            return attempt.outcome
+        outcome = self._solve_rows_at_depth(depth)
+        self.cache.record(self._cache_key, depth, outcome, self.flat_tree if outcome == FEASIBLE else None)
+        return outcome
+
+    def _solve_rows_at_depth(self, depth):
+        if len(self.active_rows) == len(self.trained_inputs):
+            return self._solve_at_depth(depth, None, self._incumbent)
+
+        # Row generation: solve on the active rows, then add the rows the tree gets most wrong, starting
+        # the next solve from the tree just found.
+        initial_tree = self._incumbent
+        while True:
+            outcome = self._solve_at_depth(depth, self.active_rows, initial_tree)
+            if outcome != FEASIBLE:
+                return outcome
+            residuals = np.abs(self.flat_tree.evaluate(self.trained_inputs) - self.trained_outputs)
+            residuals = (residuals - self._output_tolerance()).max(axis=1)
+            violated = np.flatnonzero(residuals > ROW_TOLERANCE)
+            # Active rows the tree is off on are only off within the solver's tolerances, so adding them
+            # again wouldn't change the next solve.
+            violated = np.setdiff1d(violated, self.active_rows, assume_unique=True)
+            if len(violated) == 0:
+                return outcome
+            worst = violated[np.argsort(-residuals[violated], kind="stable")[: self.lazy_rows]]
+            self.active_rows = np.union1d(self.active_rows, worst)
+            initial_tree = self.flat_tree
 
-    def _build_tree(self, depth, name):
+    def _solve_at_depth(self, depth, rows, initial_tree):
+        attempt = DepthAttempt(depth=depth, rows=len(self.trained_inputs) if rows is None else len(rows))
+        self.fit_report.attempts.append(attempt)
+        time_left = self._time_left()
+        if time_left == 0:
+            attempt.outcome = UNDECIDED
+            self._emit("attempt", attempt)
+            return attempt.outcome
+        time_limits = [limit for limit in [self.solver.time_limit, time_left] if limit is not None]
+        problem = self._make_problem(depth, rows, attempt)
+        if initial_tree is not None:
+            inputs = self.trained_inputs if rows is None else self.trained_inputs[rows]
+            self.root_node.set_initial_values(initial_tree, initial_tree.root, inputs)
+        with self._phase("solve", attempt):
+            attempt.outcome, attempt.nodes = self.solver.solve(
+                problem, min(time_limits, default=None), warm_start=initial_tree is not None
+            )
+        attempt.solver_status = solver_status(problem)
+        if attempt.outcome == FEASIBLE:
+            with self._phase("make_maps", attempt):
+                self.root_node.make_maps()
+            self._flat_tree = None
+            self._compiled = {}
+        self._emit("attempt", attempt)
+        return attempt.outcome
+
+    def _build_tree(self, depth, name, input_length, variable):
         input_width = self.trained_inputs.shape[1]
-        input_length = self.trained_inputs.shape[0]
         output_width = self.trained_outputs.shape[1]
+        bound = self.coefficient_bound
+        bounds = {} if bound is None else {"lowBound": -bound, "upBound": bound}
         if depth == 1:
             return LeafNode(
                 name,
                 np.zeros((output_width, input_width)),
-                [[pulp.LpVariable(f"{name}-{i}:{j}") for j in range(input_width)] for i in range(output_width)],
+                [[variable(f"{name}-{i}:{j}", **bounds) for j in range(input_width)] for i in range(output_width)],
             )
         else:
-            greater = self._build_tree(depth - 1, f"{name}-greater")
-            less = self._build_tree(depth - 1, f"{name}-less")
+            greater = self._build_tree(depth - 1, f"{name}-greater", input_length, variable)
+            less = self._build_tree(depth - 1, f"{name}-less", input_length, variable)
             return InternalNode(
                 name,
                 greater,
                 less,
                 np.zeros(input_width),
-                [pulp.LpVariable(f"{name}-{j}") for j in range(input_width)],
-                [
-                    pulp.LpVariable(f"{name}-choice({i})", cat="Integer", lowBound=0, upBound=1)
-                    for i in range(input_length)
-                ],
+                [variable(f"{name}-{j}", **bounds) for j in range(input_width)],
+                [variable(f"{name}-choice({i})", cat="Integer", lowBound=0, upBound=1) for i in range(input_length)],
             )
 
-    def to_python_code(self, function_name, indent=0, node=None):
-        if node == None:
-            args = self.input_vectoriser.get_args()
-            return "\n".join(
-                [f"def {function_name}({args}):"]
-                + self.to_python_code(function_name, indent=indent + 1, node=self.root_node)
-            )
-        elif hasattr(node, "linear_map"):
-            result = ["  " * indent + "return {"]
-            output_expressions = self.output_vectoriser.to_mapped_expressions(node.linear_map, self.input_vectoriser)
-            for var_name, expression in output_expressions:
-                result.append("  " * (indent + 1) + f'"{var_name}": {expression},')
-            result.append("  " * indent + "}")
+    def to_python_code(self, function_name, indent=0, node=None, as_tuple=False, shared_leaves=False):
+        """
+        With as_tuple the function returns a tuple in the order of output_vectoriser.keys(). With node,
+        returns the if statements of the subtree under node instead of a function.
+        """
+        file = io.StringIO()
+        if node is None:
+            self.write_python_code(file, function_name, indent, as_tuple, shared_leaves)
+            return file.getvalue()[:-1]
+        write_body(file, node, ExpressionCache(self.input_vectoriser, self.output_vectoriser), indent, as_tuple)
+        return file.getvalue().splitlines()
+
+    def write_python_code(self, file, function_name, indent=0, as_tuple=False, shared_leaves=False):
+        """
+        Writes the code to_python_code returns to file a line at a time. With shared_leaves each leaf map
+        that more than one leaf has becomes a function those leaves call.
+        """
+        if self.output_models is not None:
+            self._write_output_models_code(file, function_name, indent, as_tuple, shared_leaves=shared_leaves)
+            return
+        expressions = ExpressionCache(self.input_vectoriser, self.output_vectoriser)
+        args = self.input_vectoriser.get_args()
+        write_function(file, self.root_node, expressions, function_name, args, indent, as_tuple, shared_leaves)
+
+    def to_numpy_code(self, function_name, indent=0, as_tuple=False):
+        """
+        Like to_python_code, but the function takes an array of values for each argument, with nan for
+        null, and returns an array for each output.
+        """
+        if self.output_models is not None:
+            file = io.StringIO()
+            self._write_output_models_code(file, function_name, indent, as_tuple, numpy=True)
+            return file.getvalue()[:-1]
+        args = self.input_vectoriser.get_args()
+        arg_names = args.split(", ") if args else []
+        keys = []
+        expressions = ExpressionCache(self.input_vectoriser, self.output_vectoriser)
+        body = self._numpy_node_code(self.root_node, indent + 1, None, itertools.count(1), keys, expressions)
+        lines = ["  " * indent + f"def {function_name}({args}):", "  " * (indent + 1) + "import numpy as np"]
+        for name in arg_names:
+            lines.append("  " * (indent + 1) + f"{name} = np.atleast_1d(np.asarray({name}, dtype=float))")
+        if len(arg_names) > 1:
+            lines.append("  " * (indent + 1) + f"{args} = np.broadcast_arrays({args})")
+        lines.append("  " * (indent + 1) + (f"_size = len({arg_names[0]})" if arg_names else "_size = 1"))
+        lines.append("  " * (indent + 1) + "_result = {")
+        lines += ["  " * (indent + 2) + f'"{key}": np.empty(_size),' for key in keys]
+        lines.append("  " * (indent + 1) + "}")
+        lines += body
+        if as_tuple:
+            lines.append("  " * (indent + 1) + "return (")
+            lines += ["  " * (indent + 2) + f'_result["{key}"],' for key in self.output_vectoriser.keys()]
+            lines.append("  " * (indent + 1) + ")")
         else:
-            condition_expression = self.input_vectoriser.to_expression(node.condition_map)
-            result = ["  " * indent + f"if {condition_expression}:"]
-            result += self.to_python_code(function_name, indent=indent + 1, node=node.greater)
-            result += ["  " * indent + f"else:"]
-            result += self.to_python_code(function_name, indent=indent + 1, node=node.less)
+            lines.append("  " * (indent + 1) + "return _result")
+        return "\n".join(lines)
+
+    def _numpy_node_code(self, node, indent, rows, row_names, keys, expressions):
+        """
+        The lines filling in the outputs of the rows reaching node, rows being the name of their index
+        array, or None for every row. keys is filled with the output keys in order.
+        """
+        if hasattr(node, "linear_map"):
+            output_expressions = expressions.leaf(node.linear_map)
+            if not keys:
+                keys += [key for key, _ in output_expressions]
+            index = ":" if rows is None else rows
+            return [
+                "  " * indent + f'_result["{key}"][{index}] = {to_numpy_expression(expression, rows)}'
+                for key, expression in output_expressions
+            ]
+        condition = to_numpy_condition(expressions.condition(node.condition_map), rows)
+        greater, less = f"_rows_{next(row_names)}", f"_rows_{next(row_names)}"
+        result = ["  " * indent + f"_condition = {condition}"]
+        if rows is None:
+            result.append("  " * indent + f"{greater} = np.flatnonzero(_condition)")
+            result.append("  " * indent + f"{less} = np.flatnonzero(~_condition)")
+        else:
+            result.append("  " * indent + f"{greater} = {rows}[_condition]")
+            result.append("  " * indent + f"{less} = {rows}[~_condition]")
+        result += self._numpy_node_code(node.greater, indent, greater, row_names, keys, expressions)
+        result += self._numpy_node_code(node.less, indent, less, row_names, keys, expressions)
         return result
 
+    def _write_output_models_code(self, file, function_name, indent, as_tuple, numpy=False, shared_leaves=False):
+        args = self.input_vectoriser.get_args()
+        calls = []
+        for idx, (key, model) in enumerate(self.output_models.items()):
+            output_function = f"_{function_name}_{idx}"
+            if numpy:
+                file.write(model.to_numpy_code(output_function, indent=indent, as_tuple=True) + "\n")
+            else:
+                model.write_python_code(
+                    file, output_function, indent=indent, as_tuple=True, shared_leaves=shared_leaves
+                )
+            calls.append((key, f"{output_function}({args})[0]"))
+        lines = ["  " * indent + f"def {function_name}({args}):"]
+        if as_tuple:
+            lines.append("  " * (indent + 1) + "return (")
+            lines += ["  " * (indent + 2) + f"{call}," for _, call in calls]
+            lines.append("  " * (indent + 1) + ")")
+        else:
+            lines.append("  " * (indent + 1) + "return {")
+            lines += ["  " * (indent + 2) + f'"{key}": {call},' for key, call in calls]
+            lines.append("  " * (indent + 1) + "}")
+        file.write("\n".join(lines) + "\n")
+
+    def compile(self, as_tuple=False, numpy=False):
+        """
+        Returns the code from to_python_code, or to_numpy_code with numpy, as a function, taking the same
+        arguments as the generated code. The function is built once and cached on the model.
+        """
+        compiled = self.__dict__.setdefault("_compiled", {})
+        if (as_tuple, numpy) not in compiled:
+            namespace = {}
+            to_code = self.to_numpy_code if numpy else self.to_python_code
+            exec(to_code("compiled_model", as_tuple=as_tuple), namespace)
+            compiled[as_tuple, numpy] = namespace["compiled_model"]
+        return compiled[as_tuple, numpy]
+
+
+def _output_settings(settings, key):
+    """
+    The fit settings for the model of output key alone, with only its tolerance.
+    """
+    tolerance = settings["tolerance"]
+    if isinstance(tolerance, Mapping):
+        return {**settings, "tolerance": {key: tolerance[key]} if key in tolerance else None}
+    return settings
+
+
+def _output_column(outputs, key):
+    """
+    The outputs of key alone, in the same form as outputs. Rows without key stay without it.
+    """
+    if isinstance(outputs, Mapping):
+        return {key: outputs[key]}
+    return [{key: row[key]} if key in row else {} for row in outputs]
+
+
+def _frozen_nodes(tree, source):
+    """
+    Rebuilds the nodes of tree as frozen nodes, whose maps are views of the tree's arrays.
+    """
+    if source < 0:
+        return FrozenLeafNode(tree.leaf_maps[~source])
+    return FrozenInternalNode(
+        tree.condition_maps[source], _frozen_nodes(tree, tree.greater[source]), _frozen_nodes(tree, tree.less[source])
+    )
+
+
+def _gather_l1_objective(matrix, variables, abs_value_variables):
+    # creating a variable that must be greater than a map_variable and the negative of that map
+    # variable means we've created a variable that is always greater than the absolute value
+    # of the map variable. Minimizing the sum of these extra variables means we're minimizing the
+    # L1 norm of our coefficients.
+    var_columns = matrix.add_variables(variables)
+    abs_columns = matrix.add_variables(abs_value_variables)
+    pair_rows = 2 * np.arange(len(variables))
+    matrix.add_block(
+        rows=[pair_rows, pair_rows, pair_rows + 1, pair_rows + 1],
+        columns=[var_columns, abs_columns, var_columns, abs_columns],
+        values=[np.ones(len(variables)), -np.ones(len(variables)), -np.ones(len(variables)), -np.ones(len(variables))],
+        senses=LE,
+        rhs=np.zeros(2 * len(variables)),
+    )
+    matrix.add_objective(abs_columns, 1)
+
 
 @dataclass
 class LeafNode:
     name: str
     linear_map: np.ndarray
-    map_variables: list[list[pulp.LpVariable]]
+    map_variables: "list[list[pulp.LpVariable]]"
 
-    def gather_constraints(self, problem, inputs, outputs, choice_vars=None):
-        if choice_vars is None:
-            choice_vars = []
+    def gather_constraints(
+        self,
+        matrix,
+        inputs,
+        outputs,
+        path=(),
+        break_symmetry=False,
+        coefficient_bound=None,
+        tolerance=0,
+        residual_columns=None,
+    ):
+        """
+        path has a (choice_columns, is_greater) pair for each internal node above this leaf. tolerance, and
+        residual_columns when given, widen the bounds on each output.
+        """
+        input_length, input_width = inputs.shape
+        output_width = outputs.shape[1]
+        map_columns = matrix.add_variables([var for row in self.map_variables for var in row])
+        map_columns = map_columns.reshape(output_width, input_width)
 
         # for all input/output pairs make sure the map times input - output is between lower_bound and upper bound
-        for choice_idx, (input_row, output_row) in enumerate(zip(inputs, outputs)):
-            # if all the choice vars are 0 then upper_bound = lower_bound = 0
-            # if any are non zero then upper_bound >= 2 and lower_bound <= -2
-            upper_bound = 0
-            lower_bound = 0
-            for choice_var_list in choice_vars:
-                upper_bound += 2 * choice_var_list[choice_idx]
-                lower_bound += -2 * choice_var_list[choice_idx]
-            for output_map, output_value in zip(self.map_variables, output_row):
-                mapped_output = 0
-                for input_coeficient, input_value in zip(output_map, input_row):
-                    mapped_output += input_coeficient * input_value
-                constraint = mapped_output - output_value >= lower_bound
-                problem += constraint
-                constraint = mapped_output - output_value <= upper_bound
-                problem += constraint
-
-    def gather_objective(self):
-        constraints = []
-        result = 0
+        # each pair gets the lower bound row followed by the upper bound row, one pair for each output.
+        pair_rows = 2 * np.arange(input_length * output_width).reshape(input_length, output_width)
+        input_idx, input_col = np.nonzero(inputs)
+        map_rows = pair_rows[input_idx]
+        map_cols = map_columns[:, input_col].T
+        map_values = np.repeat(inputs[input_idx, input_col][:, None], output_width, axis=1)
+        rows = [map_rows, map_rows + 1]
+        columns = [map_cols, map_cols]
+        values = [map_values, map_values]
+
+        # if all the choice terms are 0 then upper_bound = lower_bound = 0
+        # if any are non zero then upper_bound >= big_m and lower_bound <= -big_m
+        # the choice term is the choice variable on the greater side and 1 - choice variable on the less side.
+        big_m = 2
+        if coefficient_bound is not None:
+            row_norms = np.abs(inputs).sum(axis=1)
+            big_m = np.minimum(2, coefficient_bound * row_norms[:, None] + np.abs(outputs))
+        big_m = np.broadcast_to(big_m, pair_rows.shape)
+        less_count = 0
+        for choice_columns, is_greater in path:
+            choice_cols = np.broadcast_to(choice_columns[:, None], pair_rows.shape)
+            coefficient = big_m if is_greater else -big_m
+            less_count += not is_greater
+            rows += [pair_rows, pair_rows + 1]
+            columns += [choice_cols, choice_cols]
+            values += [coefficient, -coefficient]
+
+        if residual_columns is not None:
+            rows += [pair_rows, pair_rows + 1]
+            columns += [residual_columns, residual_columns]
+            values += [np.ones(pair_rows.shape), -np.ones(pair_rows.shape)]
+
+        senses = np.empty(2 * input_length * output_width, dtype=np.int8)
+        senses[0::2] = GE
+        senses[1::2] = LE
+        slack = big_m * less_count + np.broadcast_to(tolerance, pair_rows.shape)
+        rhs = np.empty(2 * input_length * output_width)
+        rhs[0::2] = outputs.ravel() - slack.ravel()
+        rhs[1::2] = outputs.ravel() + slack.ravel()
+        matrix.add_block(rows, columns, values, senses, rhs)
+
+    def gather_objective(self, matrix, variable):
+        variables = []
+        abs_value_variables = []
         for i, var_list in enumerate(self.map_variables):
             for j, var in enumerate(var_list):
-                abs_value_var = pulp.LpVariable(f"{self.name}-obj-{i}:{j}")
-                # creating a variable that must be greater than a map_variable and the negative of that map
-                # variable means we've created a variable that is always greater than the absolute value
-                # of the map variable. Minimizing the sum of these extra variables means we're minimizing the
-                # L1 norm of our coefficients.
-                constraints.append(var <= abs_value_var)
-                constraints.append(-var <= abs_value_var)
-                result += abs_value_var
-        return constraints, result
+                variables.append(var)
+                abs_value_variables.append(variable(f"{self.name}-obj-{i}:{j}"))
+        _gather_l1_objective(matrix, variables, abs_value_variables)
+
+    def set_initial_values(self, tree, source, inputs):
+        """
+        Sets the MIP start of this leaf from the node source of a FlatTree. When source is an internal
+        node, the tree is deeper than this one and the map is left for the solver to fill in.
+        """
+        if source < 0:
+            for var_list, row in zip(self.map_variables, tree.leaf_maps[~source].tolist()):
+                for var, value in zip(var_list, row):
+                    var.setInitialValue(value)
 
     def make_maps(self):
         for i, row in enumerate(self.map_variables):
@@ -155,43 +988,120 @@ class InternalNode:
     greater: Union["InternalNode", LeafNode]
     less: Union["InternalNode", LeafNode]
     condition_map: np.ndarray
-    map_variables: list[pulp.LpVariable]
-    choice_variables: Optional[list[pulp.LpVariable]]
-
-    def gather_constraints(self, problem, inputs, outputs, choice_vars=None):
-        if choice_vars is None:
-            choice_vars = []
-        self.greater.gather_constraints(problem, inputs, outputs, choice_vars + [self.choice_variables])
-        self.less.gather_constraints(problem, inputs, outputs, choice_vars + [[1 - x for x in self.choice_variables]])
-        for input_row, choice_var in zip(inputs, self.choice_variables):
-            map_sum = 0
-            for x, map_var in zip(input_row, self.map_variables):
-                map_sum += x * map_var
-            # choice_variable being 0 <=> map_sum is between 0 and 2
-            # choice_variable being 1 <=> map_sum is between -2 and -0.1
-            constraint = map_sum <= (2 - 2.1 * choice_var)
-            problem += constraint
-            constraint = map_sum >= (-2 * choice_var)
-            problem += constraint
-
-    def gather_objective(self):
-        constraints, result = self.greater.gather_objective()
-        sub_constraints, sub_objective = self.less.gather_objective()
-        constraints += sub_constraints
-        result += sub_objective
-        for idx, var in enumerate(self.map_variables):
-            abs_value_var = pulp.LpVariable(f"{self.name}-obj-{idx}")
-            # creating a variable that must be greater than a map_variable and the negative of that map
-            # variable means we've created a variable that is always greater than the absolute value
-            # of the map variable. Minimizing the sum of these extra variables means we're minimizing the
-            # L1 norm of our coefficients.
-            constraints.append(var <= abs_value_var)
-            constraints.append(-var <= abs_value_var)
-            result += abs_value_var
-        return constraints, result
+    map_variables: "list[pulp.LpVariable]"
+    choice_variables: "Optional[list[pulp.LpVariable]]"
+
+    def gather_constraints(
+        self,
+        matrix,
+        inputs,
+        outputs,
+        path=(),
+        break_symmetry=False,
+        coefficient_bound=None,
+        tolerance=0,
+        residual_columns=None,
+    ):
+        map_columns = matrix.add_variables(self.map_variables)
+        choice_columns = matrix.add_variables(self.choice_variables)
+        for child, is_greater in [(self.greater, True), (self.less, False)]:
+            child.gather_constraints(
+                matrix,
+                inputs,
+                outputs,
+                path + ((choice_columns, is_greater),),
+                break_symmetry=break_symmetry,
+                coefficient_bound=coefficient_bound,
+                tolerance=tolerance,
+                residual_columns=residual_columns,
+            )
+
+        # choice_variable being 0 <=> map_sum is between greater_margin and big_m + greater_margin
+        # choice_variable being 1 <=> map_sum is between -big_m - greater_margin and -less_margin
+        # the margins are 0 and 0.1, or SYMMETRIC_MARGIN on both sides with break_symmetry.
+        # big_m is 2, or with a coefficient_bound the most map_sum can be on the row if that's less.
+        # each input row gets the upper bound row followed by the lower bound row.
+        greater_margin, less_margin = (SYMMETRIC_MARGIN, SYMMETRIC_MARGIN) if break_symmetry else (0, 0.1)
+        input_length = inputs.shape[0]
+        big_m = np.full(input_length, 2.0)
+        if coefficient_bound is not None:
+            big_m = np.minimum(big_m, coefficient_bound * np.abs(inputs).sum(axis=1))
+        choice_rows = 2 * np.arange(input_length)
+        input_idx, input_col = np.nonzero(inputs)
+        map_rows = 2 * input_idx
+        map_values = inputs[input_idx, input_col]
+        senses = np.empty(2 * input_length, dtype=np.int8)
+        senses[0::2] = LE
+        senses[1::2] = GE
+        rhs = np.empty(2 * input_length)
+        rhs[0::2] = big_m + greater_margin
+        rhs[1::2] = greater_margin
+        matrix.add_block(
+            rows=[map_rows, choice_rows, map_rows + 1, choice_rows + 1],
+            columns=[map_columns[input_col], choice_columns, map_columns[input_col], choice_columns],
+            values=[map_values, big_m + greater_margin + less_margin, map_values, big_m + 2 * greater_margin],
+            senses=senses,
+            rhs=rhs,
+        )
+
+        if break_symmetry:
+            # Every tree has a twin with this node's condition negated and its children swapped, which
+            # sends each row the other way, and with the same margin on both sides the twin is always
+            # feasible too. Only allow the one with at least as many rows on the greater side.
+            matrix.add_block(
+                rows=[np.zeros(input_length, dtype=np.int64)],
+                columns=[choice_columns],
+                values=[np.full(input_length, 2.0)],
+                senses=LE,
+                rhs=[input_length],
+            )
+
+    def gather_objective(self, matrix, variable):
+        self.greater.gather_objective(matrix, variable)
+        self.less.gather_objective(matrix, variable)
+        abs_value_variables = [variable(f"{self.name}-obj-{idx}") for idx in range(len(self.map_variables))]
+        _gather_l1_objective(matrix, self.map_variables, abs_value_variables)
+
+    def set_initial_values(self, tree, source, inputs):
+        """
+        Sets the MIP start of this subtree from node source of a FlatTree. A leaf source sends every row
+        to the greater side, with both children copying the leaf.
+        """
+        if source >= 0:
+            condition = tree.condition_maps[source]
+            greater, less = tree.greater[source], tree.less[source]
+        else:
+            condition = np.zeros(len(self.map_variables))
+            greater = less = source
+        for var, value in zip(self.map_variables, condition.tolist()):
+            var.setInitialValue(value)
+        for var, value in zip(self.choice_variables, (inputs @ condition < 0).tolist()):
+            var.setInitialValue(int(value))
+        self.greater.set_initial_values(tree, greater, inputs)
+        self.less.set_initial_values(tree, less, inputs)
 
     def make_maps(self):
         self.greater.make_maps()
         self.less.make_maps()
         for i, v in enumerate(self.map_variables):
             self.condition_map[i] = v.varValue
+
+
+class FrozenLeafNode:
+    """
+    A leaf of a frozen tree, see Model.freeze.
+    """
+
+    __slots__ = ["linear_map"]
+
+    def __init__(self, linear_map):
+        self.linear_map = linear_map
+
+
+class FrozenInternalNode:
+    __slots__ = ["condition_map", "greater", "less"]
+
+    def __init__(self, condition_map, greater, less):
+        self.condition_map = condition_map
+        self.greater = greater
+        self.less = less
@@ -0,0 +1,108 @@
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+from .report import FitReport
+from .solver import FEASIBLE, UNDECIDED
+
+# Without a max_depth, how many depths can run at once from the shallowest depth that isn't decided yet.
+# Each depth has twice the leaves of the one before, so unbounded deeper solves would only take memory
+# and CPU from the shallow ones.
+SPECULATIVE_DEPTHS = 2
+
+
+def _solve_depth(model, depth, connection):
+    if hasattr(os, "setpgrp"):
+        # Run in a process group of our own, so cancelling this depth also stops the solver it starts.
+        os.setpgrp()
+    model.fit_report = FitReport()
+    outcome = model._train_model_at_depth(depth)
+    connection.send((outcome, model.flat_tree if outcome == FEASIBLE else None, model.fit_report.attempts))
+    connection.close()
+
+
+def _cancel(process):
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+    process.terminate()
+    process.join()
+
+
+def solve_depths_in_parallel(model, n_jobs, min_depth=1, max_depth=None, stop_when_undecided=True):
+    """
+    Solves model at up to n_jobs depths at once, each in its own process, cancelling deeper depths
+    once one is feasible. Returns the outcomes, the shallowest feasible (depth, FlatTree) or None and
+    the DepthAttempts.
+    """
+    running = {}
+    outcomes = {}
+    trees = {}
+    attempts = []
+    next_depth = min_depth
+    try:
+        while True:
+            best = min(trees, default=None)
+            if best is not None and all(depth in outcomes for depth in range(min_depth, best)):
+                return outcomes, (best, trees[best]), attempts
+            undecided = UNDECIDED in outcomes.values()
+            if undecided and (stop_when_undecided or model._time_left() == 0):
+                return outcomes, None if best is None else (best, trees[best]), attempts
+
+            open_depth = next(depth for depth in itertools.count(min_depth) if depth not in outcomes)
+            while (
+                len(running) < n_jobs
+                and (max_depth is not None or next_depth < open_depth + SPECULATIVE_DEPTHS)
+                and (best is None or next_depth < best)
+                and (max_depth is None or next_depth <= max_depth)
+            ):
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_solve_depth, args=(model, next_depth, sender), daemon=True)
+                process.start()
+                sender.close()
+                running[next_depth] = (process, receiver)
+                next_depth += 1
+            if not running:
+                return outcomes, None, attempts
+
+            ready = multiprocessing.connection.wait([receiver for _, receiver in running.values()])
+            for depth in sorted(depth for depth, (_, receiver) in running.items() if receiver in ready):
+                if depth not in running:
+                    # cancelled by a shallower feasible depth that came back at the same time
+                    continue
+                process, receiver = running.pop(depth)
+                try:
+                    outcomes[depth], tree, depth_attempts = receiver.recv()
+                except EOFError:
+                    raise RuntimeError(f"The solver process for depth {depth} stopped without a result")
+                finally:
+                    receiver.close()
+                    process.join()
+                attempts += depth_attempts
+                if tree is not None:
+                    trees[depth] = tree
+                    for deeper in [d for d in running if d > depth]:
+                        process, receiver = running.pop(deeper)
+                        _cancel(process)
+                        receiver.close()
+    finally:
+        for process, receiver in running.values():
+            _cancel(process)
+            receiver.close()
+
+
+def _fit_model(model, inputs, outputs, settings):
+    model.fit(inputs, outputs, **settings)
+    return model
+
+
+def fit_models_in_parallel(jobs, n_jobs):
+    """
+    Runs model.fit(inputs, outputs, **settings) for each (model, inputs, outputs, settings) in jobs, with
+    at most n_jobs processes at once. Returns the fitted models in the order of jobs.
+    """
+    with multiprocessing.Pool(min(n_jobs, len(jobs))) as pool:
+        return pool.starmap(_fit_model, jobs)
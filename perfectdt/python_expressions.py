@@ -1,3 +1,4 @@
+import ast
 import itertools
 from dataclasses import dataclass
 
@@ -17,6 +18,17 @@ class BaseLinearTerm:
     def is_boolean(self):
         return False
 
+    def needs_parentheses(self):
+        """
+        Whether to_code binds less tightly than arithmetic, so it needs parentheses next to other terms
+        or in a comparison.
+        """
+        return False
+
+    def to_code_in_expression(self):
+        code = self.to_code()
+        return f"({code})" if self.needs_parentheses() else code
+
 
 @dataclass
 class NullCheckTerm(BaseLinearTerm):
@@ -34,6 +46,9 @@ class NullCheckTerm(BaseLinearTerm):
     def is_boolean(self):
         return self.coefficient in [1, -1]
 
+    def needs_parentheses(self):
+        return self.display_coefficient == ""
+
 
 @dataclass
 class LinearTerm(BaseLinearTerm):
@@ -53,6 +68,10 @@ class NullableVariableTerm(BaseLinearTerm):
     def is_boolean(self):
         return self.null_coefficient in [1, -1] and self.coefficient == 0
 
+    def needs_parentheses(self):
+        # c * (x or 0) is already in parentheses, x or 0 and the bare if else forms aren't
+        return self.display_coefficient == "" or self.null_coefficient not in [0, self.coefficient, -self.coefficient]
+
     def to_code(self):
         cf = self.display_coefficient
         if self.null_coefficient == 0:
@@ -60,16 +79,13 @@ class NullableVariableTerm(BaseLinearTerm):
                 return f"{self.var_name} or 0"
             else:
                 return f"{self.display_coefficient}({self.var_name} or 0)"
-        elif self.null_coefficient == self.coefficient:
-            if cf == "":
-                return f"{self.var_name} or 1"
-            else:
-                return f"{self.display_coefficient}({self.var_name} or 1)"
-        elif self.null_coefficient == -self.coefficient:
+        elif self.null_coefficient in [self.coefficient, -self.coefficient]:
+            # x or 1 would be 1 for x == 0 too, unlike x or 0
+            default = 1 if self.null_coefficient == self.coefficient else -1
             if cf == "":
-                return f"{self.var_name} or -1"
+                return f"{self.var_name} if {self.var_name} is not None else {default}"
             else:
-                return f"{self.display_coefficient}({self.var_name} or -1)"
+                return f"{self.display_coefficient}({self.var_name} if {self.var_name} is not None else {default})"
         elif self.sign == "+":
             return (
                 f"{self.display_coefficient}{self.var_name} if {self.var_name} is not None else {self.null_coefficient}"
@@ -87,13 +103,15 @@ class ExpressionBuilder:
         self.tolerance = 14
 
     def add_coefficient(self, key, value):
+        value = round(value, self.tolerance)
         if value != 0:
-            self.coefficients[key] = round(value, self.tolerance)
+            self.coefficients[key] = value
             self.all_keys.add(key)
 
     def add_is_null_coefficient(self, key, value):
+        value = round(value, self.tolerance)
         if value != 0:
-            self.null_coefficients[key] = round(value, self.tolerance)
+            self.null_coefficients[key] = value
             self.all_keys.add(key)
 
     def add_constant_term(self, value):
@@ -134,6 +152,19 @@ class ExpressionBuilder:
                     result.append(LinearTerm(key, self.coefficients[key]))
         return result
 
+    def is_conditional(self):
+        """
+        Whether to_code is a bare x if x is not None else c, which needs parentheses inside another if else.
+        """
+        terms = self._terms()
+        return (
+            len(terms) == 1
+            and self.constant == 0
+            and terms[0].sign == "+"
+            and isinstance(terms[0], NullableVariableTerm)
+            and terms[0].null_coefficient != 0
+        )
+
     def to_code(self):
         terms = self._terms()
         if len(terms) == 0:
@@ -145,9 +176,13 @@ class ExpressionBuilder:
         result = []
         if terms[0].sign == "-":
             result.append("-")
-        result.append(terms[0].to_code())
+        if len(terms) == 1 and self.constant == 0 and terms[0].sign == "+":
+            # on its own a term needs no parentheses
+            result.append(terms[0].to_code())
+        else:
+            result.append(terms[0].to_code_in_expression())
         for term in terms[1:]:
-            result.append(f" {term.sign} {term.to_code()}")
+            result.append(f" {term.sign} {term.to_code_in_expression()}")
 
         if self.constant > 0:
             result.append(f" + {self.constant}")
@@ -223,9 +258,9 @@ class BooleanExpressionBuilder(ExpressionBuilder):
         rhs = []
         for term in terms:
             if term.sign == "-":
-                rhs.append(term.to_code())
+                rhs.append(term.to_code_in_expression())
             elif term.sign == "+":
-                lhs.append(term.to_code())
+                lhs.append(term.to_code_in_expression())
         if self.constant == 0:
             # This condition is true if self.constant == -0.0, the second zero in floating point.
             # This means we always display 0 as 0, and never as 0.0 or -0.0
@@ -237,7 +272,7 @@ class BooleanExpressionBuilder(ExpressionBuilder):
         elif self.constant > 0:
             lhs.append(str(self.constant))
         elif self.constant < 0:
-            rhs.append(str(self.constant))
+            rhs.append(str(-self.constant))
 
         return " >= ".join([" + ".join(lhs), " + ".join(rhs)])
 
@@ -253,7 +288,106 @@ class NullableExpression:
             self._condition_inverted = True
             self.condition.scale_by(-1)
         condition_code = self.condition.to_code()
+        value_code = self.value.to_code()
         if condition_code == "True":
-            return f"{self.value.to_code()}"
-        else:
-            return f"({self.value.to_code()} if {condition_code} else None)"
+            return value_code
+        if self.value.is_conditional():
+            value_code = f"({value_code})"
+        return f"({value_code} if {condition_code} else None)"
+
+
+NUMPY_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+NUMPY_COMPARISONS = {ast.GtE: ">=", ast.Gt: ">", ast.LtE: "<=", ast.Lt: "<", ast.Eq: "==", ast.NotEq: "!="}
+
+
+def to_numpy_expression(code, rows=None):
+    """
+    Converts code, an expression from to_code, into one evaluating it for arrays of values with nan for
+    None, keeping Python's semantics exactly. With rows each variable is indexed by rows first.
+    """
+    return _NumpyConverter(rows).convert(ast.parse(code, mode="eval").body)[0]
+
+
+def to_numpy_condition(code, rows=None):
+    """
+    Like to_numpy_expression, but gives a boolean array of the rows code is truthy for, as the
+    condition of an if statement.
+    """
+    return _truthy(*_NumpyConverter(rows).convert(ast.parse(code, mode="eval").body))
+
+
+class _NumpyConverter:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def convert(self, node):
+        """
+        Returns (code, is_boolean), is_boolean being whether code gives booleans, which numpy
+        combines with | and & instead of or and and.
+        """
+        match node:
+            case ast.Name(id=name):
+                return (name if self.rows is None else f"{name}[{self.rows}]"), False
+            case ast.Constant(value=None):
+                return "np.nan", False
+            case ast.Constant(value=bool() as value):
+                return repr(value), True
+            case ast.Constant(value=int() | float() as value):
+                return repr(value), False
+            case ast.UnaryOp(op=ast.USub(), operand=operand):
+                return f"(-{_number(*self.convert(operand))})", False
+            case ast.UnaryOp(op=ast.Not(), operand=operand):
+                return f"(~{_truthy(*self.convert(operand))})", True
+            case ast.BinOp(left=left, op=op, right=right) if type(op) in NUMPY_OPERATORS:
+                left, right = _number(*self.convert(left)), _number(*self.convert(right))
+                return f"({left} {NUMPY_OPERATORS[type(op)]} {right})", False
+            case ast.Compare(left=left, ops=ops, comparators=comparators):
+                return self._compare(left, ops, comparators), True
+            case ast.BoolOp(op=op, values=values):
+                return self._bool_op(isinstance(op, ast.Or), [self.convert(value) for value in values])
+            case ast.IfExp(test=test, body=body, orelse=orelse):
+                (body, body_is_boolean), (orelse, orelse_is_boolean) = self.convert(body), self.convert(orelse)
+                return (
+                    f"np.where({_truthy(*self.convert(test))}, {body}, {orelse})",
+                    body_is_boolean and orelse_is_boolean,
+                )
+        raise ValueError(f"Can't convert expression to numpy: ({ast.unparse(node)})")
+
+    def _compare(self, left, ops, comparators):
+        # a chain like a >= b >= c is a >= b and b >= c
+        parts = []
+        for op, right in zip(ops, comparators):
+            if isinstance(op, (ast.Is, ast.IsNot)):
+                if not (isinstance(right, ast.Constant) and right.value is None):
+                    raise ValueError(f"Can't convert expression to numpy: ({ast.unparse(right)})")
+                is_null = f"np.isnan({self.convert(left)[0]})"
+                parts.append(is_null if isinstance(op, ast.Is) else f"(~{is_null})")
+            elif type(op) in NUMPY_COMPARISONS:
+                left_code, right_code = _number(*self.convert(left)), _number(*self.convert(right))
+                parts.append(f"({left_code} {NUMPY_COMPARISONS[type(op)]} {right_code})")
+            else:
+                raise ValueError(f"Can't convert expression to numpy: ({ast.unparse(op)})")
+            left = right
+        return parts[0] if len(parts) == 1 else f"({' & '.join(parts)})"
+
+    def _bool_op(self, is_or, values):
+        if all(is_boolean for _, is_boolean in values):
+            return f"({(' | ' if is_or else ' & ').join(code for code, _ in values)})", True
+        # a or b is a when a is truthy and b otherwise, a and b is b when a is truthy and a otherwise
+        code, is_boolean = values[-1]
+        for value in reversed(values[:-1]):
+            if is_or and code == "0" and not value[1]:
+                # the guard a or 0 is only a when a isn't null, as a is 0 when it's 0
+                code, is_boolean = f"np.where(np.isnan({value[0]}), 0, {value[0]})", False
+                continue
+            first, second = (value[0], code) if is_or else (code, value[0])
+            code, is_boolean = f"np.where({_truthy(*value)}, {first}, {second})", is_boolean and value[1]
+        return code, is_boolean
+
+
+def _truthy(code, is_boolean):
+    return code if is_boolean else f"(~np.isnan({code}) & ({code} != 0))"
+
+
+def _number(code, is_boolean):
+    return f"(1 * {code})" if is_boolean else code
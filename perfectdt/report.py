@@ -0,0 +1,74 @@
+from dataclasses import dataclass, field
+import gc
+import sys
+import types
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+@dataclass
+class DepthAttempt:
+    """
+    One solve of the problem at a given depth. With lazy_rows a depth can take several attempts.
+    phases has the wall time in seconds of each step of the attempt.
+    """
+
+    depth: int
+    rows: int
+    variables: int = 0
+    constraints: int = 0
+    nonzeros: int = 0
+    outcome: Optional[str] = None
+    solver_status: Optional[str] = None
+    nodes: Optional[int] = None
+    phases: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class FitReport:
+    """
+    Where Model.fit spent its time, the wall time of each phase in seconds, and peak and freed memory
+    in bytes.
+    """
+
+    phases: dict[str, float] = field(default_factory=dict)
+    attempts: list[DepthAttempt] = field(default_factory=list)
+    input_rows: int = 0
+    unique_rows: int = 0
+    peak_memory: Optional[int] = None
+    solver_peak_memory: Optional[int] = None
+    freed_memory: Optional[int] = None
+
+    def add_phase(self, name, seconds, attempt=None):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+        if attempt is not None:
+            attempt.phases[name] = attempt.phases.get(name, 0) + seconds
+
+    def record_peak_memory(self):
+        if resource is None:
+            return
+        # ru_maxrss is in kilobytes on linux
+        self.peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.solver_peak_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+
+def deep_size(*objects):
+    """
+    Estimates the bytes held by objects and everything they reference, counting each object once.
+    Classes, modules and functions are shared with everything else, so they aren't counted.
+    """
+    seen = set()
+    size = 0
+    pending = list(objects)
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending += gc.get_referents(obj)
+    return size
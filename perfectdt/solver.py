@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+import os
+import re
+import sys
+import tempfile
+from typing import Optional
+
+FEASIBLE = "feasible"
+INFEASIBLE = "infeasible"
+# The solver stopped before finding a tree or proving there isn't one, usually because of a time limit.
+UNDECIDED = "undecided"
+
+ON_TIMEOUT = ["raise", "deeper"]
+
+NODE_COUNT_PATTERNS = {
+    "cbc": re.compile(r"Enumerated nodes:\s+(\d+)"),
+    "coin": re.compile(r"Enumerated nodes:\s+(\d+)"),
+    "highs": re.compile(r"^\s*Nodes\s+(\d+)", re.MULTILINE),
+}
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+@dataclass
+class SolverConfig:
+    """
+    How each depth gets solved. backend is "cbc", "coin", "highs" or "glpk". On running out of time,
+    on_timeout="raise" stops the search and "deeper" tries deeper trees.
+    """
+
+    backend: str = "cbc"
+    threads: Optional[int] = None
+    time_limit: Optional[float] = None
+    total_time_limit: Optional[float] = None
+    mip_gap: Optional[float] = None
+    msg: bool = True
+    on_timeout: str = "raise"
+
+    def __post_init__(self):
+        if self.on_timeout not in ON_TIMEOUT:
+            raise ValueError(f"Unknown on_timeout: ({self.on_timeout})")
+
+    def make_solver(self, time_limit=None, warm_start=False, log_path=None):
+        # pulp is imported here rather than at the top, so perfectdt can be imported for predicting alone
+        import pulp
+
+        if self.backend in ["cbc", "coin", "highs"]:
+            solver_class = {"cbc": pulp.PULP_CBC_CMD, "coin": pulp.COIN_CMD, "highs": pulp.HiGHS_CMD}[self.backend]
+            # CBC only writes its log to log_path with msg off, solve shows it afterwards instead
+            solver = solver_class(
+                msg=self.msg and (log_path is None or self.backend == "highs"),
+                timeLimit=time_limit,
+                gapRel=self.mip_gap,
+                threads=self.threads,
+                warmStart=warm_start,
+                logPath=log_path,
+            )
+        elif self.backend == "glpk":
+            # glpk is single threaded and has no MIP start
+            options = [] if self.mip_gap is None else ["--mipgap", str(self.mip_gap)]
+            solver = pulp.GLPK_CMD(msg=self.msg, timeLimit=time_limit, options=options)
+        else:
+            raise ValueError(f"Unknown solver backend: ({self.backend})")
+        if not solver.available():
+            raise ValueError(f"The {self.backend} solver isn't available")
+        return solver
+
+    def solve(self, problem, time_limit=None, warm_start=False):
+        """
+        Solves problem, returning (outcome, nodes). nodes is the number of branch and bound nodes the
+        solver explored, read from its log, or None for backends whose log isn't read. With msg the log is
+        shown as well.
+        """
+        if self.backend not in NODE_COUNT_PATTERNS:
+            problem.solve(self.make_solver(time_limit, warm_start))
+            return solve_outcome(problem), None
+
+        handle, log_path = tempfile.mkstemp(suffix=".log")
+        os.close(handle)
+        try:
+            problem.solve(self.make_solver(time_limit, warm_start, log_path))
+            with open(log_path) as log:
+                text = log.read()
+        finally:
+            os.remove(log_path)
+        if self.msg and self.backend != "highs":
+            sys.stdout.write(text)
+        match = NODE_COUNT_PATTERNS[self.backend].search(text)
+        return solve_outcome(problem), None if match is None else int(match.group(1))
+
+
+def solve_outcome(problem):
+    import pulp
+
+    if problem.sol_status in [pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible]:
+        return FEASIBLE
+    if problem.status == pulp.LpStatusInfeasible:
+        return INFEASIBLE
+    return UNDECIDED
+
+
+def solver_status(problem):
+    import pulp
+
+    return pulp.LpStatus[problem.status]
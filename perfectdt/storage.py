@@ -0,0 +1,66 @@
+"""
+The file format of Model.save: MAGIC, the header length, a JSON header and then each array,
+aligned so it can be memory mapped.
+"""
+
+import json
+import numpy as np
+
+MAGIC = b"PDTMODEL"
+VERSION = 1
+ALIGNMENT = 64
+
+
+def write(path, metadata, arrays):
+    """
+    Writes metadata, anything JSON can encode, and arrays, a dict of numpy arrays, to path.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    descriptions = {}
+    # the offsets are relative to the end of the header, which is padded to ALIGNMENT
+    offset = 0
+    for name, array in arrays.items():
+        descriptions[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({"version": VERSION, "metadata": metadata, "arrays": descriptions}).encode()
+    header += b" " * (_aligned(len(MAGIC) + 8 + len(header)) - len(MAGIC) - 8 - len(header))
+
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(np.uint64(len(header)).astype("<u8").tobytes())
+        file.write(header)
+        position = 0
+        for name, array in arrays.items():
+            file.write(b"\0" * (descriptions[name]["offset"] - position))
+            file.write(array.tobytes())
+            position = descriptions[name]["offset"] + array.nbytes
+
+
+def read(path, mmap=True):
+    """
+    Returns the (metadata, arrays) written to path. With mmap the arrays are read only memory maps of the
+    file, otherwise they are read into memory.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a saved model: ({path})")
+        header_length = int(np.frombuffer(file.read(8), dtype="<u8")[0])
+        header = json.loads(file.read(header_length))
+        if header["version"] > VERSION:
+            raise ValueError(f"Saved model has an unsupported version: ({header['version']})")
+        start = len(MAGIC) + 8 + header_length
+        arrays = {}
+        for name, description in header["arrays"].items():
+            dtype = np.dtype(description["dtype"])
+            shape = tuple(description["shape"])
+            if mmap and np.prod(shape) > 0:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=start + description["offset"], shape=shape)
+            else:
+                file.seek(start + description["offset"])
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+    return header["metadata"], arrays
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -1,43 +1,109 @@
+from collections.abc import Mapping
+from itertools import islice
+from operator import itemgetter
 import numpy as np
 from .python_expressions import BooleanExpressionBuilder, ExpressionBuilder, NullableExpression
 
+# Rows held at once when reading an iterable that isn't a list
+CHUNK_SIZE = 10000
+
 
 class Vectoriser:
     def __init__(self, include_constant=True):
         self.include_constant = int(include_constant)
 
-    def fit(self, inputs):
+    def fit(self, inputs, chunk_size=None):
+        """
+        Learns the keys, which can be None and their ranges from a list of dicts, a dict of columns or
+        any iterable of dicts, reading chunk_size rows at a time.
+        """
         self.input_keys = {}
         self.null_keys = {}
         self.float_keys = {}
         self.ranges = {}
-        for input_dict in inputs:
-            for key, value in input_dict.items():
-                if key not in self.input_keys:
-                    self.input_keys[key] = len(self.input_keys)
-                if value is None:
-                    if ("null", key) not in self.input_keys:
-                        null_idx = len(self.input_keys)
-                        self.input_keys[("null", key)] = null_idx
-                        self.null_keys[key] = null_idx
-                elif not isinstance(value, (int, float)):
-                    raise ValueError(f"Can't handle value: ({value})")
-                else:
-                    self.float_keys[key] = self.input_keys[key]
-                    if key not in self.ranges:
-                        self.ranges[key] = (value, value)
-                    else:
-                        old_min, old_max = self.ranges[key]
-                        self.ranges[key] = (min(old_min, value), max(old_max, value))
+        for chunk in _chunks(inputs, chunk_size):
+            self._fit_chunk(chunk)
+
+    def _fit_chunk(self, inputs):
+        _, columns, layouts = get_columns(inputs)
+        first_seen = []
+        for key, (values, is_null, present) in columns.items():
+            # kind 0 numbers the key, 1 its null indicator, 2 makes it a float key
+            for kind, rows in enumerate([present, present & is_null, present & ~is_null]):
+                rows = np.flatnonzero(rows)
+                if len(rows) > 0:
+                    first_seen.append((*_position(layouts, key, rows[0]), kind, key))
+
+        for _, _, kind, key in sorted(first_seen, key=lambda seen: seen[:3]):
+            if kind == 2:
+                self.float_keys.setdefault(key, self.input_keys[key])
+                values, is_null, present = columns[key]
+                values = values[present & ~is_null]
+                min_val, max_val = values.min().item(), values.max().item()
+                if key in self.ranges:
+                    old_min, old_max = self.ranges[key]
+                    min_val, max_val = min(old_min, min_val), max(old_max, max_val)
+                self.ranges[key] = (min_val, max_val)
+            elif kind == 1:
+                if key not in self.null_keys:
+                    self.null_keys[key] = self.input_keys[("null", key)] = len(self.input_keys)
+            elif key not in self.input_keys:
+                self.input_keys[key] = len(self.input_keys)
+
+    def to_vectors(self, inputs, out=None, chunk_size=None):
+        """
+        Converts every row of inputs to a matrix, null for missing keys, None and nan. With out the rows
+        are written into that array, chunk_size at a time.
+        """
+        if out is None and isinstance(inputs, (list, Mapping)) and chunk_size is None:
+            return self._to_block(inputs)
+        if out is None:
+            return np.concatenate(list(self.iter_vectors(inputs, chunk_size)) or [np.zeros((0, self.width))])
+        row = 0
+        for block in self.iter_vectors(inputs, chunk_size):
+            if row + len(block) > len(out):
+                raise ValueError(f"There are more rows than out has room for: ({len(out)})")
+            out[row : row + len(block)] = block
+            row += len(block)
+        if row != len(out):
+            raise ValueError(f"There are fewer rows than out has room for: ({row} < {len(out)})")
+        return out
+
+    def iter_vectors(self, inputs, chunk_size=None):
+        """
+        Converts inputs chunk_size rows at a time (CHUNK_SIZE by default), yielding a matrix for each
+        chunk.
+        """
+        for chunk in _chunks(inputs, chunk_size or CHUNK_SIZE):
+            yield self._to_block(chunk)
 
-    def to_vectors(self, inputs):
-        result = np.zeros((len(inputs), len(self.input_keys) + self.include_constant))
-        for row, value_dict in enumerate(inputs):
-            self._update_vector(result[row], value_dict)
+    @property
+    def width(self):
+        return len(self.input_keys) + self.include_constant
+
+    def _to_block(self, inputs):
+        row_count, columns, _ = get_columns(inputs, self.keys())
+        result = np.zeros((row_count, self.width))
+        for key, idx in self.input_keys.items():
+            if not isinstance(key, str):
+                continue
+            if key not in columns:
+                if ("null", key) in self.input_keys:
+                    result[:, self.input_keys[("null", key)]] = 1
+                continue
+            values, is_null, present = columns[key]
+            is_null = is_null | ~present
+            if ("null", key) in self.input_keys:
+                result[:, self.input_keys[("null", key)]] = is_null
+            if not is_null.all():
+                a, b = self._forward_scale_map(key)
+                result[:, idx] = np.where(is_null, 0, a * values + b)
+        if self.include_constant:
+            result[:, -1] = 1
         return result
 
     def to_vector(self, inputs):
-        result = np.zeros(len(self.input_keys) + self.include_constant)
+        result = np.zeros(self.width)
         self._update_vector(result, inputs)
         return result
 
@@ -45,13 +111,14 @@ class Vectoriser:
         for key, idx in self.input_keys.items():
             match key:
                 case ("null", str):
-                    if value_dict.get(key[1]) is None:
+                    value = value_dict.get(key[1])
+                    if value is None or value != value:
                         vector[idx] = 1
                     else:
                         vector[idx] = 0
                 case str:
                     value = value_dict.get(key)
-                    if value is None:
+                    if value is None or value != value:
                         vector[idx] = 0
                     else:
                         vector[idx] = self.to_scaled_value(key, value)
@@ -82,39 +149,207 @@ class Vectoriser:
                 result[key] = self.from_scaled_value(key, vector[idx])
         return result
 
-    def to_expression(self, vector):
-        return self._to_expression_builder(vector, True).to_code()
+    def from_vectors(self, vectors, as_matrix=False):
+        """
+        The inverse of to_vectors. With as_matrix the result has one column per key in the order of
+        keys(), with nan where the value is None.
+        """
+        keys = self.keys()
+        values = np.full((len(vectors), len(keys)), np.nan)
+        is_null = np.zeros(values.shape, dtype=bool)
+        for column, key in enumerate(keys):
+            if key in self.float_keys:
+                a, b = self._forward_scale_map(key)
+                values[:, column] = (vectors[:, self.float_keys[key]] - b) / a
+            if key in self.null_keys:
+                is_null[:, column] = vectors[:, self.null_keys[key]] > 0.5
+        values[is_null] = np.nan
+        if as_matrix:
+            return values
+
+        present = is_null.copy()
+        present[:, [key in self.float_keys for key in keys]] = True
+        result = []
+        for row_values, row_present, row_is_null in zip(values.tolist(), present.tolist(), is_null.tolist()):
+            result.append(
+                {
+                    key: None if null else value
+                    for key, value, is_present, null in zip(keys, row_values, row_present, row_is_null)
+                    if is_present
+                }
+            )
+        return result
+
+    def to_dict(self):
+        """
+        Everything a fitted Vectoriser needs, in a form JSON can encode.
+        """
+        return {
+            "include_constant": self.include_constant,
+            "input_keys": [[list(key) if isinstance(key, tuple) else key, idx] for key, idx in self.input_keys.items()],
+            "null_keys": self.null_keys,
+            "float_keys": self.float_keys,
+            "ranges": self.ranges,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        vectoriser = cls(include_constant=state["include_constant"])
+        vectoriser.input_keys = {tuple(key) if isinstance(key, list) else key: idx for key, idx in state["input_keys"]}
+        vectoriser.null_keys = dict(state["null_keys"])
+        vectoriser.float_keys = dict(state["float_keys"])
+        vectoriser.ranges = {key: tuple(value_range) for key, value_range in state["ranges"].items()}
+        return vectoriser
+
+    def extended(self, inputs):
+        """
+        A copy of this vectoriser fit to inputs as well. Existing keys and null indicators keep their
+        columns, new ones are numbered after them, and ranges widen to cover inputs.
+        """
+        vectoriser = Vectoriser.from_dict(self.to_dict())
+        for chunk in _chunks(inputs, None):
+            vectoriser._fit_chunk(chunk)
+        return vectoriser
+
+    def convert_vectors(self, vectors, old):
+        """
+        Converts vectors from old.to_vectors into what to_vectors would give for the same rows, where this
+        vectoriser is old.extended(...).
+        """
+        result = np.zeros((len(vectors), self.width))
+        for key, idx in self.float_keys.items():
+            if key not in old.float_keys:
+                # the rows never had a value for key
+                continue
+            if key in old.null_keys:
+                is_null = vectors[:, old.null_keys[key]] > 0.5
+            else:
+                is_null = np.zeros(len(vectors), dtype=bool)
+            min_val, max_val = old.ranges[key]
+            if min_val == max_val:
+                values = np.full(len(vectors), float(min_val))
+            else:
+                values = old.from_scaled_value(key, vectors[:, old.float_keys[key]])
+            result[:, idx] = np.where(is_null, 0, self.to_scaled_value(key, values))
+        for key, idx in self.null_keys.items():
+            if key in old.null_keys:
+                result[:, idx] = vectors[:, old.null_keys[key]]
+            elif key not in old.float_keys:
+                # missing keys count as null
+                result[:, idx] = 1
+        if self.include_constant:
+            result[:, -1] = 1
+        return result
+
+    def vector_map_from(self, old):
+        """
+        The matrix T with old_vector = T @ vector for every row, vector being what to_vectors gives for
+        the row and old_vector what old.to_vectors gives, where this vectoriser is old.extended(...). Maps
+        applied to old's vectors can be moved over to this vectoriser's by multiplying them by T.
+        """
+        if not self.include_constant:
+            raise ValueError("Only vectorisers with a constant column can map vectors")
+        result = np.zeros((old.width, self.width))
+        for key, old_idx in old.float_keys.items():
+            idx = self.float_keys[key]
+            a, b = self._forward_scale_map(key)
+            old_a, old_b = old._forward_scale_map(key)
+            if a == 0:
+                # the range hasn't changed from a single value
+                result[old_idx, idx] = 1
+                continue
+            # the old value is old_a * (value - b) / a + old_b, or 0 if the key is null
+            result[old_idx, idx] = old_a / a
+            shift = old_b - old_a * b / a
+            result[old_idx, -1] += shift
+            if key in self.null_keys:
+                result[old_idx, self.null_keys[key]] -= shift
+        for key, old_idx in old.null_keys.items():
+            result[old_idx, self.null_keys[key]] = 1
+        if old.include_constant:
+            result[-1, -1] = 1
+        return result
 
-    def _to_expression_builder(self, vector, is_boolean):
+    def convert_maps(self, maps, old, constant_column=-1):
+        """
+        Converts maps, whose second last axis is old's vector, so that they give this vectoriser's
+        vector instead, where this vectoriser is old.extended(...). The last axis of maps is an input
+        vector, with the constant in constant_column.
+        """
+        result = np.zeros(maps.shape[:-2] + (self.width, maps.shape[-1]))
+        constant = np.zeros(maps.shape[-1])
+        constant[constant_column] = 1
+        for key, idx in self.float_keys.items():
+            if key not in old.float_keys:
+                continue
+            values = maps[..., old.float_keys[key], :]
+            a, b = self._forward_scale_map(key)
+            old_a, old_b = old._forward_scale_map(key)
+            if a == 0:
+                result[..., idx, :] = values
+            elif old_a == 0:
+                # old's value is 1 whenever the key isn't null
+                result[..., idx, :] = self.to_scaled_value(key, old.ranges[key][0]) * values
+            else:
+                not_null = constant - maps[..., old.null_keys[key], :] if key in old.null_keys else constant
+                result[..., idx, :] = a / old_a * values + (b - a * old_b / old_a) * not_null
+        for key, idx in self.null_keys.items():
+            if key in old.null_keys:
+                result[..., idx, :] = maps[..., old.null_keys[key], :]
+            elif key not in old.float_keys:
+                result[..., idx, :] = constant
+        return result
+
+    def keys(self):
+        return [key for key in self.input_keys if isinstance(key, str)]
+
+    def scale_maps(self):
+        """
+        The (a, b) of each float key's a * value + b, for passing to the methods generating code for many
+        maps in a row.
+        """
+        return {key: self._forward_scale_map(key) for key in self.float_keys}
+
+    def to_expression(self, vector, scale_maps=None):
+        return self._to_expression_builder(vector, True, scale_maps).to_code()
+
+    def _to_expression_builder(self, vector, is_boolean, scale_maps=None):
         if is_boolean:
             builder = BooleanExpressionBuilder()
         else:
             builder = ExpressionBuilder()
         builder.nullable_keys = self.null_keys
 
+        null_offsets = {}
         for key, idx in self.float_keys.items():
-            a, b = self._forward_scale_map(key)
+            a, b = self._forward_scale_map(key) if scale_maps is None else scale_maps[key]
             builder.add_coefficient(key, a * vector[idx])
             builder.add_constant_term(b * vector[idx])
+            # a null value is 0 in its column rather than b, so take back the constant term for it
+            null_offsets[key] = -b * vector[idx]
 
         for key, idx in self.null_keys.items():
-            builder.add_is_null_coefficient(key, vector[idx])
+            builder.add_is_null_coefficient(key, vector[idx] + null_offsets.get(key, 0))
 
         if self.include_constant:
             builder.add_constant_term(vector[-1])
 
         return builder
 
-    def to_mapped_expressions(self, matrix, input_vectoriser):
+    def to_mapped_expressions(self, matrix, input_vectoriser, scale_maps=None, input_scale_maps=None):
+        """
+        The code of each output of the leaf with map matrix, as (key, code) pairs. scale_maps and
+        input_scale_maps, from scale_maps, save working them out again for every leaf.
+        """
         result = {}
 
         for key, idx in self.null_keys.items():
-            condition = input_vectoriser._to_expression_builder(matrix[idx], True)
+            condition = input_vectoriser._to_expression_builder(matrix[idx], True, input_scale_maps)
             result[key] = NullableExpression(condition=condition)
 
         for key, idx in self.float_keys.items():
-            result_expression = input_vectoriser._to_expression_builder(matrix[idx], False)
-            a, b = self._forward_scale_map(key)
+            result_expression = input_vectoriser._to_expression_builder(matrix[idx], False, input_scale_maps)
+            a, b = self._forward_scale_map(key) if scale_maps is None else scale_maps[key]
             result_expression.shift_by(-b)
             result_expression.scale_by(1 / a)
             if key in result:
@@ -126,3 +361,84 @@ class Vectoriser:
 
     def get_args(self):
         return ", ".join(self.float_keys.keys())
+
+
+def get_columns(inputs, keys=None):
+    """
+    Transposes inputs, a list of dicts or a dict of columns, into columns. Returns (row_count,
+    columns, layouts), columns mapping each key to (values, is_null, present).
+    """
+    if isinstance(inputs, Mapping):
+        lengths = {len(column) for column in inputs.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: ({sorted(lengths)})")
+        row_count = lengths.pop() if lengths else 0
+        layout_keys = [tuple(inputs)]
+        row_layout = np.zeros(row_count, dtype=np.int64)
+        all_present = np.ones(row_count, dtype=bool)
+        columns = {
+            key: (*_column_values(column), all_present) for key, column in inputs.items() if keys is None or key in keys
+        }
+        return row_count, columns, (layout_keys, row_layout)
+
+    # Rows nearly always share a handful of layouts, so presence is worked out per layout, not per row.
+    row_keys = list(map(tuple, inputs))
+    layout_ids = {layout: idx for idx, layout in enumerate(dict.fromkeys(row_keys))}
+    if len(layout_ids) == 1:
+        row_layout = np.zeros(len(inputs), dtype=np.int64)
+    else:
+        row_layout = np.fromiter(map(layout_ids.__getitem__, row_keys), dtype=np.int64, count=len(inputs))
+    layout_keys = list(layout_ids)
+    all_keys = dict.fromkeys(key for layout in layout_keys for key in layout)
+    columns = {}
+    for key in all_keys if keys is None else [key for key in keys if key in all_keys]:
+        layouts_with_key = [idx for idx, layout in enumerate(layout_keys) if key in layout]
+        if len(layouts_with_key) == len(layout_keys):
+            present = np.ones(len(inputs), dtype=bool)
+            column = list(map(itemgetter(key), inputs))
+        else:
+            present = np.isin(row_layout, layouts_with_key)
+            column = [row.get(key) for row in inputs]
+        columns[key] = (*_column_values(column), present)
+    return len(inputs), columns, (layout_keys, row_layout)
+
+
+def _chunks(inputs, chunk_size):
+    if chunk_size is None:
+        if isinstance(inputs, (list, Mapping)):
+            yield inputs
+            return
+        chunk_size = CHUNK_SIZE
+    if isinstance(inputs, Mapping):
+        row_count = len(next(iter(inputs.values()), []))
+        for start in range(0, row_count, chunk_size):
+            yield {key: column[start : start + chunk_size] for key, column in inputs.items()}
+        return
+    rows = iter(inputs)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def get_row(inputs, row):
+    """
+    Returns row number row of inputs as a dict, inputs being either form get_columns accepts.
+    """
+    if isinstance(inputs, Mapping):
+        return {key: column[row] for key, column in inputs.items()}
+    return inputs[row]
+
+
+def _column_values(column):
+    if isinstance(column, np.ndarray) and column.dtype.kind in "biuf":
+        values = column.astype(float)
+        return values, np.isnan(values)
+    for value_type in set(map(type, column)):
+        if value_type is not type(None) and not issubclass(value_type, (int, float)):
+            raise ValueError(f"Can't handle value: ({next(v for v in column if type(v) is value_type)})")
+    values = np.array(column, dtype=float).reshape(len(column))
+    return values, np.isnan(values)
+
+
+def _position(layouts, key, row):
+    layout_keys, row_layout = layouts
+    return row, layout_keys[row_layout[row]].index(key)
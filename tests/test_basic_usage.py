@@ -1,5 +1,6 @@
 import pytest
 from perfectdt import Model
+import perfectdt.model
 
 
 def test_find_relu():
@@ -121,12 +122,12 @@ def test_find_the_one_thats_not_null():
     """
     This one shows that we need to improve expressions underneath boolean expressions.
 
-    x or 0 is a guard to convert x being None into 0
+    x if x is not None else 1 is a guard to convert x being None into 1
 
     but in this example the expression is only evaluated when the if statement "x is not None" is
     True, meaning the guard is unnecessary.
 
-    (y or 0 if y is not None else None)
+    ((y if y is not None else 1) if y is not None else None)
 
     is the same as y on its own
 
@@ -145,11 +146,11 @@ def test_find_the_one_thats_not_null():
 def x_or_y(x, y):
   if x is not None:
     return {
-      "z": x or 0,
+      "z": x if x is not None else 1,
     }
   else:
     return {
-      "z": (y or 0 if y is not None else None),
+      "z": ((y if y is not None else 1) if y is not None else None),
     }
 """
     )
@@ -194,3 +195,336 @@ def x_and_y_are_None(x, y):
     }
 """,
     ]
+
+
+def test_compile():
+    options = [0, 1, 2, None]
+    inputs = [{"x": i, "y": j} for i in options for j in options]
+    outputs = [{"z": d["x"] if d["x"] is not None else d["y"]} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs)
+
+    x_or_y = model.compile()
+    assert model.compile() is x_or_y
+    assert [x_or_y(d["x"], d["y"]) for d in inputs] == outputs
+    x_or_y_tuple = model.compile(as_tuple=True)
+    assert [x_or_y_tuple(d["x"], d["y"]) for d in inputs] == [(d["z"],) for d in outputs]
+
+
+def test_compile_matches_predict():
+    # the condition has terms on both sides and a negative constant, and the leaves guard a nullable
+    # input that is 0 on some rows
+    inputs = [{"x": x, "y": y, "w": w} for x in range(-3, 4) for y in range(-3, 4) for w in [None, 0, 2]]
+    outputs = [{"z": (d["x"] if d["x"] >= d["y"] + 2 else d["y"]) + (1 if d["w"] is None else d["w"])} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, mode="heuristic")
+
+    function = model.compile()
+    for row in inputs:
+        assert function(**row)["z"] == pytest.approx(model.predict(row)["z"])
+
+
+@pytest.mark.parametrize(
+    "depth_search, max_depth",
+    [("linear", None), ("galloping", 3), ("binary", 3), ("parallel", None), ("break_symmetry", None)],
+)
+def test_depth_search(depth_search, max_depth):
+    inputs = [{"x": i} for i in range(-4, 5)]
+    outputs = [{"y": min(max(0, value["x"]), 2)} for value in inputs]
+
+    model = Model()
+    if depth_search == "parallel":
+        model.fit(inputs, outputs, n_jobs=3)
+    elif depth_search == "break_symmetry":
+        model.fit(inputs, outputs, break_symmetry=True)
+    else:
+        model.fit(inputs, outputs, depth_search=depth_search, max_depth=max_depth)
+
+    assert model.depth == 3
+    assert model.predict_batch(inputs, as_matrix=True).round(9).tolist() == [[d["y"]] for d in outputs]
+
+
+def test_max_depth_too_shallow():
+    inputs = [{"x": i} for i in range(-4, 5)]
+    outputs = [{"y": min(max(0, value["x"]), 2)} for value in inputs]
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, max_depth=2)
+
+
+def test_lazy_rows():
+    inputs = [{"x": i, "y": j} for i in range(-3, 3) for j in range(-3, 3)]
+    outputs = [{"z": max(value["y"], value["x"])} for value in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, lazy_rows=6, freeze=False)
+
+    assert model.depth == 2
+    assert len(model.active_rows) < len(inputs)
+    assert model.predict_batch(inputs, as_matrix=True).round(9).tolist() == [[d["z"]] for d in outputs]
+
+
+def test_duplicate_rows_are_collapsed():
+    inputs = [{"x": -2}, {"x": -1}, {"x": 0}, {"x": 1}, {"x": 2}] * 3
+    outputs = [{"y": max(0, value["x"])} for value in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, freeze=False)
+
+    assert len(model.trained_inputs) == 5
+    assert model.compression_ratio == 3
+    assert model.predict_batch(inputs, as_matrix=True).round(9).tolist() == [[d["y"]] for d in outputs]
+
+
+def test_fit_no_rows():
+    model = Model()
+    model.fit([], [])
+
+    assert model.depth == 1
+    assert model.compression_ratio == 1
+
+def test_conflicting_rows():
+    inputs = [{"x": 0}, {"x": 1}, {"x": 0}]
+    outputs = [{"y": 0}, {"y": 1}, {"y": 2}]
+
+    with pytest.raises(ValueError, match=r"rows \[0, 2\] have inputs \{'x': 0\}"):
+        Model().fit(inputs, outputs)
+
+
+def test_freeze():
+    inputs = [{"x": i, "y": j} for i in range(-3, 3) for j in range(-3, 3)]
+    outputs = [{"z": max(value["y"], value["x"])} for value in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, freeze=False)
+    code = model.to_python_code("f")
+    predictions = model.predict_batch(inputs)
+
+    freed_memory = model.freeze()
+    assert freed_memory > 0
+    assert model.fit_report.freed_memory == freed_memory
+    assert not hasattr(model, "trained_inputs")
+    assert not hasattr(model.root_node, "__dict__")
+    assert model.to_python_code("f") == code
+    assert model.predict_batch(inputs) == predictions
+    assert [model.predict(row) for row in inputs] == predictions
+
+
+def test_partial_fit():
+    inputs = [{"x": x} for x in [0, 1, 2]]
+    outputs = [{"y": max(0, d["x"])} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, freeze=False)
+    assert model.depth == 1
+
+    # the range widens but the tree still fits, so nothing is solved
+    assert not model.partial_fit([{"x": 3}], [{"y": 3}])
+    assert len(model.trained_inputs) == 4
+    assert model.input_vectoriser.ranges["x"] == (0, 3)
+    predictions = model.predict_batch([{"x": x} for x in range(4)], as_matrix=True)
+    assert predictions.round(6).tolist() == [[x] for x in range(4)]
+
+    assert model.partial_fit([{"x": -1}, {"x": -2}], [{"y": 0}, {"y": 0}])
+    assert model.depth == 2
+    predictions = model.predict_batch([{"x": x} for x in range(-2, 4)], as_matrix=True)
+    assert predictions.round(6).tolist() == [[max(0, x)] for x in range(-2, 4)]
+
+    model.freeze()
+    with pytest.raises(ValueError):
+        model.partial_fit([{"x": 4}], [{"y": 4}])
+
+
+def test_coefficient_bound():
+    inputs = [{"x": x} for x in range(-2, 3)]
+    outputs = [{"y": max(0, d["x"])} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, coefficient_bound=8)
+    assert model.depth == 2
+    assert model.predict_batch(inputs, as_matrix=True).round(6).tolist() == [[d["y"]] for d in outputs]
+    assert abs(model.flat_tree.leaf_maps).max() <= 8 + 1e-6
+
+    # the slope of y is 2 once x and y are vectorised, so no leaf can fit it
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, max_depth=2, coefficient_bound=1)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_per_output(n_jobs):
+    inputs = [{"x": x, "y": y} for x in range(-2, 3) for y in range(-2, 3)]
+    outputs = [{"a": max(0, d["x"]), "b": d["x"] + d["y"]} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, per_output=True, n_jobs=n_jobs)
+    assert {key: output_model.depth for key, output_model in model.output_models.items()} == {"a": 2, "b": 1}
+    assert model.depth == 2
+
+    f = model.compile()
+    f_tuple = model.compile(as_tuple=True)
+    predictions = model.predict_batch(inputs)
+    for row, expected, prediction in zip(inputs, outputs, predictions):
+        assert {key: round(value, 6) for key, value in model.predict(row).items()} == expected
+        assert {key: round(value, 6) for key, value in prediction.items()} == expected
+        assert {key: round(value, 6) for key, value in f(**row).items()} == expected
+        assert tuple(round(value, 6) for value in f_tuple(**row)) == (expected["a"], expected["b"])
+    assert model.predict_batch(inputs, as_matrix=True).round(6).tolist() == [[d["a"], d["b"]] for d in outputs]
+
+    with pytest.raises(ValueError):
+        model.save("model.pdt")
+
+
+def test_tolerance():
+    inputs = [{"x": x} for x in range(-4, 5)] + [{"x": 0}]
+    # noisy relu, with x = 0 seen twice
+    outputs = [{"y": max(0, d["x"]) + 0.01 * (-1) ** i} for i, d in enumerate(inputs)]
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, tolerance=0.005, max_depth=4)
+
+    for tolerance in [0.01, {"y": 0.01}]:
+        model = Model()
+        model.fit(inputs, outputs, tolerance=tolerance)
+        assert model.depth == 2
+        assert max(abs(model.predict(i)["y"] - o["y"]) for i, o in zip(inputs, outputs)) <= 0.01 + 1e-6
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, tolerance={"z": 0.01})
+
+
+def test_minimise_residual():
+    inputs = [{"x": x} for x in range(-2, 3)]
+    outputs = [{"y": max(0, d["x"])} for d in inputs]
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, residual="max")
+
+    model = Model()
+    model.fit(inputs, outputs, residual="max", max_depth=1)
+    assert model.depth == 1
+    assert max(abs(model.predict(i)["y"] - o["y"]) for i, o in zip(inputs, outputs)) == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("suffix", [".mps", ".lp"])
+def test_export_problem(tmp_path, suffix):
+    import subprocess
+    import pulp
+
+    inputs = [{"x": x, "y": y} for x in range(-2, 3) for y in range(-2, 3)]
+    outputs = [{"z": max(d["x"], d["y"])} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, solve=False)
+    model.export_problem(tmp_path / f"problem{suffix}", 2)
+    subprocess.run(
+        [pulp.PULP_CBC_CMD().path, tmp_path / f"problem{suffix}", "solve", "solution", tmp_path / "problem.sol"],
+        check=True,
+        capture_output=True,
+    )
+    tree = model.import_solution(tmp_path / "problem.sol", 2)
+    assert tree.depth == 2
+    assert model.predict_batch(inputs, as_matrix=True).round(6).tolist() == [[d["z"]] for d in outputs]
+    model.freeze()
+
+    with pytest.raises(ValueError):
+        model.export_problem(tmp_path / f"problem{suffix}", 2)
+
+
+def test_numpy_code():
+    options = [0, 1, 2, None]
+    inputs = [{"x": i, "y": j} for i in options for j in options]
+    outputs = [{"z": d["x"] if d["x"] is not None else d["y"], "w": 2 if d["y"] is None else 0} for d in inputs]
+
+    for per_output in [False, True]:
+        model = Model()
+        model.fit(inputs, outputs, per_output=per_output)
+        f = model.compile()
+        f_numpy = model.compile(numpy=True)
+        predictions = f_numpy(x=[d["x"] for d in inputs], y=[d["y"] for d in inputs])
+        for idx, row in enumerate(inputs):
+            for key, value in f(**row).items():
+                prediction = predictions[key][idx].item()
+                assert prediction == value or (value is None and prediction != prediction)
+
+        z, w = model.compile(as_tuple=True, numpy=True)(x=1, y=None)
+        assert (z.tolist(), w.tolist()) == ([1], [2])
+
+
+def test_write_python_code():
+    import io
+
+    inputs = [{"x": x} for x in range(-3, 4)]
+    outputs = [{"y": 1 if abs(d["x"]) <= 1 else 0} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs, mode="heuristic")
+    file = io.StringIO()
+    model.write_python_code(file, "bump")
+    assert file.getvalue() == model.to_python_code("bump") + "\n"
+
+    # both sides of the bump return 0
+    code = model.to_python_code("bump", shared_leaves=True)
+    assert code.startswith("def _bump_leaf_0(x):\n")
+    assert code.count("return _bump_leaf_0(x)") == 2
+    namespace = {}
+    exec(code, namespace)
+    for row, expected in zip(inputs, outputs):
+        assert round(namespace["bump"](**row)["y"], 6) == expected["y"]
+
+
+def test_minimise_residual_with_conflicting_rows():
+    inputs = [{"x": x} for x in range(-2, 3)] + [{"x": 0}]
+    outputs = [{"y": max(0, d["x"])} for d in inputs[:-1]] + [{"y": 0.3}]
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs)
+
+    model = Model()
+    model.fit(inputs, outputs, residual="max", max_depth=2)
+    assert model.fit_report.unique_rows == 6
+    # the two rows at x = 0 are best split down the middle
+    assert max(abs(model.predict(i)["y"] - o["y"]) for i, o in zip(inputs, outputs)) == pytest.approx(0.15)
+
+
+def test_lazy_rows_stop_when_only_active_rows_are_off(monkeypatch):
+    inputs = [{"x": i, "y": j} for i in range(-3, 3) for j in range(-3, 3)]
+    outputs = [{"z": max(value["y"], value["x"])} for value in inputs]
+    # every row counts as off, as rows can be by the solver's tolerances
+    monkeypatch.setattr(perfectdt.model, "ROW_TOLERANCE", -1)
+
+    model = Model()
+    model.fit(inputs, outputs, lazy_rows=12, freeze=False)
+    assert len(model.active_rows) == len(inputs)
+    assert model.predict_batch(inputs, as_matrix=True).round(9).tolist() == [[d["z"]] for d in outputs]
+
+
+@pytest.mark.parametrize("target", ["clamp", "max"])
+def test_break_symmetry_keeps_depth(target):
+    if target == "clamp":
+        inputs = [{"x": i} for i in range(-4, 5)]
+        outputs = [{"y": min(max(0, value["x"]), 2)} for value in inputs]
+    else:
+        inputs = [{"x": x, "y": y} for x in range(-2, 3) for y in range(-2, 3)]
+        outputs = [{"z": max(value["x"], value["y"])} for value in inputs]
+
+    depths = []
+    for break_symmetry in [False, True]:
+        model = Model()
+        model.fit(inputs, outputs, break_symmetry=break_symmetry)
+        assert model.predict_batch(inputs, as_matrix=True).round(9).tolist() == [list(d.values()) for d in outputs]
+        depths.append(model.depth)
+    assert depths[0] == depths[1]
+
+
+@pytest.mark.parametrize("per_output", [False, True])
+def test_fit_generators(per_output):
+    inputs = [{"x": i} for i in range(-2, 3)]
+    outputs = [{"y": max(0, value["x"])} for value in inputs]
+
+    model = Model()
+    model.fit((row for row in inputs), (row for row in outputs), per_output=per_output)
+
+    assert model.depth == 2
+    assert [model.predict(row)["y"] for row in inputs] == pytest.approx([d["y"] for d in outputs])
@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import numpy as np
+from perfectdt import Model, ModelCache, SolverConfig
+from perfectdt.flat_tree import FlatTree
+
+
+def clamp_data(limit):
+    inputs = [{"x": i} for i in range(-4, 5)]
+    outputs = [{"y": min(max(0, value["x"]), limit)} for value in inputs]
+    return inputs, outputs
+
+
+def test_cache(tmp_path):
+    cache = ModelCache(tmp_path)
+    inputs, outputs = clamp_data(2)
+    model = Model()
+    model.fit(inputs, outputs, solver=SolverConfig(msg=False), cache=cache)
+    assert [attempt.outcome for attempt in model.fit_report.attempts] == ["infeasible", "infeasible", "feasible"]
+
+    cached = Model()
+    cached.fit(inputs, outputs, cache=cache)
+    assert [attempt.solver_status for attempt in cached.fit_report.attempts] == ["cached"] * 3
+    assert cached.depth == 3
+    assert cached.to_python_code("f") == model.to_python_code("f")
+
+    # different settings are a different entry
+    other = Model()
+    other.fit(inputs, outputs, regularise=None, solver=SolverConfig(msg=False), cache=cache)
+    assert "cached" not in {attempt.solver_status for attempt in other.fit_report.attempts}
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_cache_eviction(tmp_path):
+    cache = ModelCache(tmp_path)
+    inputs = [{"x": x} for x in [-2, -1, 0, 1, 2]]
+
+    def fit(slope):
+        model = Model()
+        model.fit(
+            inputs, [{"y": max(0, slope * value["x"])} for value in inputs], solver=SolverConfig(msg=False), cache=cache
+        )
+        return [attempt.solver_status for attempt in model.fit_report.attempts]
+
+    fit(1)
+    (entry,) = os.listdir(tmp_path)
+    # room for one entry but not two
+    size = sum(os.path.getsize(path) for path in (tmp_path / entry).iterdir())
+    cache.max_bytes = size * 3 // 2
+    fit(2)
+    assert len(os.listdir(tmp_path)) == 1
+    assert fit(2) == ["cached", "cached"]
+    assert "cached" not in fit(1)
+
+
+def _record(directory, depth):
+    tree = FlatTree(
+        np.zeros((0, 2)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.full((1, 1, 2), depth)
+    )
+    ModelCache(directory).record("key", depth, "feasible" if depth % 2 else "infeasible", tree)
+
+
+def test_cache_concurrent_records(tmp_path):
+    with multiprocessing.Pool(4) as pool:
+        pool.starmap(_record, [(tmp_path, depth) for depth in range(1, 17)])
+    cache = ModelCache(tmp_path)
+    for depth in range(1, 17):
+        outcome, tree = cache.lookup("key", depth)
+        if depth % 2:
+            assert outcome == "feasible" and tree.leaf_maps[0, 0, 0] == depth
+        else:
+            assert outcome == "infeasible" and tree is None
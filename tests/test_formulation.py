@@ -0,0 +1,112 @@
+import numpy as np
+import pulp
+import pytest
+from perfectdt.formulation import GE, LE, ConstraintMatrix, Variable, read_solution
+
+
+def test_blocks_are_stacked_in_order():
+    x = pulp.LpVariable("x")
+    y = pulp.LpVariable("y")
+    matrix = ConstraintMatrix()
+    columns = matrix.add_variables([x, y])
+    # x + 2y <= 3, x >= 1
+    matrix.add_block(
+        rows=[np.array([0, 0])],
+        columns=[columns],
+        values=[np.array([1, 2])],
+        senses=pulp.LpConstraintLE,
+        rhs=[3],
+    )
+    matrix.add_block(
+        rows=[np.array([0])],
+        columns=[matrix.add_variables([x])],
+        values=[np.array([1])],
+        senses=pulp.LpConstraintGE,
+        rhs=[1],
+    )
+    matrix.add_objective(columns, 1)
+
+    indptr, csr_columns, values, senses, rhs = matrix.to_csr()
+    assert indptr.tolist() == [0, 2, 3]
+    assert csr_columns.tolist() == [0, 1, 0]
+    assert values.tolist() == [1, 2, 1]
+    assert senses.tolist() == [pulp.LpConstraintLE, pulp.LpConstraintGE]
+    assert rhs.tolist() == [3, 1]
+
+    problem = pulp.LpProblem()
+    matrix.add_to_problem(problem)
+    constraints = [
+        ({var.name: value for var, value in c.items()}, c.sense, -c.constant) for c in problem.constraints.values()
+    ]
+    assert constraints == [({"x": 1, "y": 2}, pulp.LpConstraintLE, 3), ({"x": 1}, pulp.LpConstraintGE, 1)]
+    assert {var.name: value for var, value in problem.objective.items()} == {"x": 1, "y": 1}
+
+
+def test_write_problem_files(tmp_path):
+    matrix = ConstraintMatrix()
+    x = Variable("x-0:1", lowBound=-2, upBound=2)
+    c = Variable("c", cat="Integer", lowBound=0, upBound=1)
+    y = Variable("y")
+    columns = matrix.add_variables([x, c, y])
+    # x - 2c >= -1, x + y <= 3
+    matrix.add_block(
+        rows=[np.array([0, 0, 1, 1])],
+        columns=[columns[[0, 1, 0, 2]]],
+        values=[np.array([1, -2, 1, 1])],
+        senses=np.array([GE, LE]),
+        rhs=[-1, 3],
+    )
+    matrix.add_objective(columns[[0, 2]], 1)
+
+    matrix.write_mps(tmp_path / "problem.mps")
+    assert (tmp_path / "problem.mps").read_text().splitlines() == [
+        "NAME perfectdt",
+        "ROWS",
+        " N OBJ",
+        " G R0",
+        " L R1",
+        "COLUMNS",
+        " x_0.1 R0 1.0",
+        " x_0.1 R1 1.0",
+        " x_0.1 OBJ 1.0",
+        " MARKER 'MARKER' 'INTORG'",
+        " c R0 -2.0",
+        " MARKER 'MARKER' 'INTEND'",
+        " y R1 1.0",
+        " y OBJ 1.0",
+        "RHS",
+        " RHS R0 -1.0",
+        " RHS R1 3.0",
+        "BOUNDS",
+        " LO BND x_0.1 -2.0",
+        " UP BND x_0.1 2.0",
+        " BV BND c",
+        " FR BND y",
+        "ENDATA",
+    ]
+
+    matrix.write_lp(tmp_path / "problem.lp")
+    assert (tmp_path / "problem.lp").read_text().splitlines() == [
+        "\\ perfectdt",
+        "Minimize",
+        " OBJ: + 1 x_0.1 + 1 y",
+        "Subject To",
+        " R0: + 1.0 x_0.1 - 2.0 c >= -1.0",
+        " R1: + 1.0 x_0.1 + 1.0 y <= 3.0",
+        "Bounds",
+        " -2.0 <= x_0.1 <= 2.0",
+        " 0.0 <= c <= 1.0",
+        " y free",
+        "Generals",
+        " c",
+        "End",
+    ]
+
+
+def test_read_solution(tmp_path):
+    path = tmp_path / "problem.sol"
+    path.write_text("Optimal - objective value 1.5\n      0 x_0.1  -0.5  0\n**    2 y  2  0\n")
+    assert read_solution(path) == {"x_0.1": -0.5, "y": 2.0}
+    path.write_text("Infeasible - objective value 0\n")
+    with pytest.raises(ValueError):
+        read_solution(path)
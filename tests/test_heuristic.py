@@ -0,0 +1,78 @@
+import pytest
+from perfectdt import Model
+from perfectdt.flat_tree import FlatTree
+from perfectdt.heuristic import build_tree, fits_formulation
+
+
+def clamp_data():
+    inputs = [{"x": x, "y": y} for x in range(-3, 4) for y in range(-3, 4)]
+    outputs = [{"z": min(max(d["x"] + d["y"], 0), 3)} for d in inputs]
+    return inputs, outputs
+
+
+def test_heuristic_mode():
+    inputs, outputs = clamp_data()
+    model = Model()
+    model.fit(inputs, outputs, mode="heuristic")
+    assert model.depth == 3
+    assert model.fit_report.attempts == []
+    f = model.compile()
+    for row, expected in zip(inputs, outputs):
+        assert round(model.predict(row)["z"], 6) == expected["z"]
+        assert round(f(**row)["z"], 6) == expected["z"]
+
+    with pytest.raises(ValueError):
+        Model().fit(inputs, outputs, mode="heuristic", max_depth=2)
+
+
+def max_data():
+    inputs = [{"x": x, "y": y} for x in range(-2, 3) for y in range(-2, 3)]
+    outputs = [{"z": max(d["x"], d["y"])} for d in inputs]
+    return inputs, outputs
+
+
+def test_heuristic_tree_is_a_mip_start():
+    inputs, outputs = max_data()
+    model = Model()
+    model.fit(inputs, outputs, freeze=False, mode="heuristic")
+    tree = build_tree(model.trained_inputs, model.trained_outputs)
+    assert tree.depth == 2
+    assert fits_formulation(tree, model.trained_inputs, model.trained_outputs)
+    assert not fits_formulation(tree, model.trained_inputs, model.trained_outputs, coefficient_bound=0.5)
+
+
+def test_mirrored_tree_breaks_symmetry():
+    inputs, outputs = max_data()
+    model = Model()
+    model.fit(inputs, outputs, freeze=False, mode="heuristic")
+    tree = build_tree(model.trained_inputs, model.trained_outputs)
+    assert fits_formulation(tree, model.trained_inputs, model.trained_outputs, break_symmetry=True)
+    # the same tree with its root's condition negated sends 15 of the 25 rows to the less side
+    mirrored = FlatTree(-tree.condition_maps, tree.less, tree.greater, tree.leaf_maps)
+    assert fits_formulation(mirrored, model.trained_inputs, model.trained_outputs)
+    assert not fits_formulation(mirrored, model.trained_inputs, model.trained_outputs, break_symmetry=True)
+
+
+def test_seeded_mode():
+    inputs, outputs = max_data()
+    model = Model()
+    # the greedy tree's depth is the top of the binary search
+    model.fit(inputs, outputs, mode="seeded", depth_search="binary")
+    assert [attempt.depth for attempt in model.fit_report.attempts] == [2, 1]
+    assert model.depth == 2
+    for row, expected in zip(inputs, outputs):
+        assert round(model.predict(row)["z"], 6) == expected["z"]
+
+
+def test_heuristic_code_with_nullable_inputs():
+    options = [0, 1, 2, None]
+    inputs = [{"x": i, "y": j} for i in options for j in options]
+    outputs = [{"z": d["x"] if d["x"] is not None else d["y"]} for d in inputs]
+    model = Model()
+    model.fit(inputs, outputs, mode="heuristic")
+    code = model.to_python_code("x_or_y")
+    assert "nan" not in code and "inf" not in code
+    f = model.compile()
+    for row, expected in zip(inputs, outputs):
+        prediction = f(**row)["z"]
+        assert (prediction is None) if expected["z"] is None else round(prediction, 6) == expected["z"]
@@ -0,0 +1,35 @@
+import subprocess
+import sys
+from perfectdt import Model
+from perfectdt.inference import Predictor
+
+
+def fit_model():
+    inputs = [{"x": x, "y": y} for x in range(-3, 3) for y in range(-3, 3)]
+    outputs = [{"z": max(d["x"], d["y"])} for d in inputs]
+    model = Model()
+    model.fit(inputs, outputs)
+    return model, inputs
+
+
+def test_predictor_matches_model(tmp_path):
+    model, inputs = fit_model()
+    model.save(tmp_path / "model.pdt")
+    expected = [model.predict(row) for row in inputs]
+    for predictor in [model.predictor(), Predictor.load(tmp_path / "model.pdt")]:
+        assert [predictor.predict(row) for row in inputs] == expected
+        assert predictor.predict_batch(inputs) == expected
+
+
+def test_predicting_does_not_import_pulp(tmp_path):
+    model, _ = fit_model()
+    model.save(tmp_path / "model.pdt")
+    script = f"""
+import sys
+import perfectdt
+from perfectdt.inference import Predictor
+assert Predictor.load({str(tmp_path / "model.pdt")!r}).predict({{"x": 1, "y": 2}}) == {{"z": 2}}
+assert perfectdt.Model.load({str(tmp_path / "model.pdt")!r}).predict({{"x": 1, "y": 2}}) == {{"z": 2}}
+assert "pulp" not in sys.modules
+"""
+    subprocess.run([sys.executable, "-c", script], check=True)
@@ -0,0 +1,44 @@
+import time
+from perfectdt.parallel import SPECULATIVE_DEPTHS, solve_depths_in_parallel
+from perfectdt.solver import FEASIBLE, INFEASIBLE
+
+
+class DepthModel:
+    """
+    Stands in for a Model, recording each depth it's asked to solve as a file in directory. Depth 1
+    takes seconds to solve, and records which depths had started by the time it's done.
+    """
+
+    def __init__(self, directory, feasible_depth, seconds=0):
+        self.directory = directory
+        self.feasible_depth = feasible_depth
+        self.seconds = seconds
+        self.flat_tree = "tree"
+
+    def _train_model_at_depth(self, depth):
+        (self.directory / str(depth)).touch()
+        if depth == 1:
+            time.sleep(self.seconds)
+            (self.directory / "running").write_text(" ".join(path.name for path in self.directory.iterdir()))
+        return FEASIBLE if depth >= self.feasible_depth else INFEASIBLE
+
+    def _time_left(self):
+        return None
+
+
+def _started(directory):
+    return sorted(int(path.name) for path in directory.iterdir() if path.name.isdigit())
+
+
+def test_deep_depths_wait_for_shallow_ones(tmp_path):
+    outcomes, result, _ = solve_depths_in_parallel(DepthModel(tmp_path, 3), n_jobs=8)
+    assert result == (3, "tree")
+    assert outcomes[1] == outcomes[2] == INFEASIBLE
+    assert max(_started(tmp_path)) <= 3 + SPECULATIVE_DEPTHS - 1
+
+
+def test_max_depth_runs_every_depth_at_once(tmp_path):
+    outcomes, result, _ = solve_depths_in_parallel(DepthModel(tmp_path, 4, seconds=1), n_jobs=4, max_depth=4)
+    assert result == (4, "tree")
+    assert _started(tmp_path) == [1, 2, 3, 4]
+    assert sorted((tmp_path / "running").read_text().split()) == ["1", "2", "3", "4"]
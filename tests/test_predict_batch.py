@@ -0,0 +1,24 @@
+import numpy as np
+from perfectdt import Model
+
+
+def test_predict_batch_matches_predict():
+    options = [0, 1, 2, None]
+    inputs = [{"x": i, "y": j} for i in options for j in options]
+    outputs = [{"z": d["x"] if d["x"] is not None else d["y"]} for d in inputs]
+
+    model = Model()
+    model.fit(inputs, outputs)
+
+    expected = [model.predict(row) for row in inputs]
+    assert model.predict_batch(inputs) == expected
+    assert model.predict_batch(model.input_vectoriser.to_vectors(inputs)) == expected
+
+    matrix = model.predict_batch(inputs, as_matrix=True)
+    assert model.output_vectoriser.keys() == ["z"]
+    assert matrix.shape == (len(inputs), 1)
+    for row, prediction in zip(matrix, expected):
+        if prediction["z"] is None:
+            assert np.isnan(row[0])
+        else:
+            assert np.isclose(row[0], prediction["z"])
@@ -0,0 +1,58 @@
+import pytest
+from perfectdt import Model, SolverConfig, SolverTimeout
+
+
+def relu_data():
+    inputs = [{"x": -2}, {"x": -1}, {"x": 0}, {"x": 1}, {"x": 2}]
+    outputs = [{"y": max(0, value["x"])} for value in inputs]
+    return inputs, outputs
+
+
+def test_solver_settings():
+    model = Model()
+    model.fit(*relu_data(), solver=SolverConfig(threads=1, time_limit=60, mip_gap=0, msg=False))
+
+    assert model.depth == 2
+    assert model.undecided_depths == []
+
+
+
+def test_node_counts_with_default_config(capsys):
+    model = Model()
+    model.fit(*relu_data())
+
+    assert all(attempt.nodes is not None for attempt in model.fit_report.attempts)
+    # the solver log is still shown
+    assert "Enumerated nodes" in capsys.readouterr().out
+
+def test_out_of_time():
+    with pytest.raises(SolverTimeout):
+        Model().fit(*relu_data(), solver=SolverConfig(total_time_limit=0))
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        Model().fit(*relu_data(), solver=SolverConfig(backend="abacus"))
+    with pytest.raises(ValueError):
+        SolverConfig(on_timeout="retry")
+
+
+def test_fit_report():
+    events = []
+    model = Model(hooks=[lambda event, data: events.append((event, data))])
+    model.fit(*relu_data(), solver=SolverConfig(msg=False))
+
+    report = model.fit_report
+    assert [(attempt.depth, attempt.outcome) for attempt in report.attempts] == [(1, "infeasible"), (2, "feasible")]
+    assert report.attempts[1].rows == 5
+    assert report.attempts[1].variables > 0
+    assert report.attempts[1].constraints > 0
+    assert report.attempts[1].nonzeros > 0
+    assert report.attempts[1].solver_status == "Optimal"
+    assert report.attempts[1].nodes is not None
+    assert {"fit_vectorisers", "to_vectors", "train", "gather_constraints", "solve"} <= set(report.phases)
+    assert report.input_rows == report.unique_rows == 5
+
+    assert [data for event, data in events if event == "attempt"] == report.attempts
+    assert events[-1] == ("fit", report)
+    assert ("phase", {"name": "train", "seconds": report.phases["train"], "depth": None}) in events
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from perfectdt import Model
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load(tmp_path, mmap):
+    options = [0, 1, 2, None]
+    inputs = [{"x": i, "y": j} for i in options for j in options]
+    outputs = [{"z": d["x"] if d["x"] is not None else d["y"]} for d in inputs]
+    model = Model()
+    model.fit(inputs, outputs)
+    model.save(tmp_path / "model.pdt")
+
+    loaded = Model.load(tmp_path / "model.pdt", mmap=mmap)
+    assert isinstance(loaded.flat_tree.leaf_maps, np.memmap) == mmap
+    assert loaded.depth == model.depth
+    assert loaded.input_vectoriser.input_keys == model.input_vectoriser.input_keys
+    assert [loaded.predict(row) for row in inputs] == [model.predict(row) for row in inputs]
+    assert loaded.predict_batch(inputs) == model.predict_batch(inputs)
+    assert loaded.to_python_code("f") == model.to_python_code("f")
+    assert loaded.compile()(1, None) == {"z": 1}
+
+
+def test_load_rejects_other_files(tmp_path):
+    (tmp_path / "model.pdt").write_bytes(b"not a model")
+    with pytest.raises(ValueError, match="Not a saved model"):
+        Model.load(tmp_path / "model.pdt")
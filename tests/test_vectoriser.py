@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from perfectdt.vectoriser import Vectoriser
+
+
+def test_columns_match_rows():
+    rows = [{"b": 3, "a": None}, {"a": 1.5, "b": None, "c": 2}, {"c": -1, "a": 4}]
+    columns = {
+        "b": [3, None, None],
+        "a": np.array([np.nan, 1.5, 4]),
+        "c": [None, 2, -1],
+    }
+    from_rows = Vectoriser()
+    from_rows.fit(rows)
+    # keys are numbered as they are first seen, a null indicator when its key is first None
+    assert from_rows.input_keys == {"b": 0, "a": 1, ("null", "a"): 2, ("null", "b"): 3, "c": 4}
+    assert list(from_rows.float_keys) == ["b", "a", "c"]
+    assert from_rows.ranges == {"a": (1.5, 4), "b": (3, 3), "c": (-1, 2)}
+
+    from_columns = Vectoriser()
+    from_columns.fit(columns)
+    # a column is null where a row is missing the key, so c gets a null indicator here
+    assert from_columns.input_keys == {"b": 0, "a": 1, ("null", "a"): 2, "c": 3, ("null", "c"): 4, ("null", "b"): 5}
+    assert from_columns.ranges == from_rows.ranges
+
+    vectors = from_rows.to_vectors(rows)
+    assert np.array_equal(vectors, np.array([from_rows.to_vector(row) for row in rows]))
+    assert np.array_equal(vectors, from_rows.to_vectors(columns))
+
+
+def test_unknown_values():
+    with pytest.raises(ValueError, match="Can't handle value"):
+        Vectoriser().fit([{"x": 1}, {"x": "2"}])
+    with pytest.raises(ValueError, match="Can't handle value"):
+        Vectoriser().fit({"x": np.array(["1", "2"])})
+
+
+def test_streaming(tmp_path):
+    def rows():
+        for i in range(25):
+            yield {"x": i % 7, "y": None if i % 3 == 0 else -i}
+
+    in_memory = Vectoriser()
+    in_memory.fit(list(rows()))
+    streamed = Vectoriser()
+    streamed.fit(rows(), chunk_size=4)
+    assert streamed.input_keys == in_memory.input_keys
+    assert streamed.ranges == in_memory.ranges
+
+    expected = in_memory.to_vectors(list(rows()))
+    assert [len(block) for block in streamed.iter_vectors(rows(), chunk_size=10)] == [10, 10, 5]
+    assert np.array_equal(streamed.to_vectors(rows(), chunk_size=10), expected)
+    out = np.lib.format.open_memmap(tmp_path / "vectors.npy", mode="w+", shape=expected.shape)
+    assert streamed.to_vectors(rows(), out=out, chunk_size=10) is out
+    assert np.array_equal(np.load(tmp_path / "vectors.npy"), expected)
+    with pytest.raises(ValueError, match="more rows"):
+        streamed.to_vectors(rows(), out=np.zeros((20, expected.shape[1])))
+
+
+def test_extended():
+    old_rows = [{"x": 0, "y": 1}, {"x": 2, "y": None}]
+    new_rows = [{"x": -2, "y": 5, "z": 1}, {"x": 4, "y": None, "z": None}]
+    old = Vectoriser()
+    old.fit(old_rows)
+    new = old.extended(new_rows)
+    assert list(new.input_keys)[: len(old.input_keys)] == list(old.input_keys)
+    assert new.ranges == {"x": (-2, 4), "y": (1, 5), "z": (1, 1)}
+
+    assert np.allclose(new.convert_vectors(old.to_vectors(old_rows), old), new.to_vectors(old_rows))
+    rows = old_rows + [{"x": 3, "y": 2}]
+    assert np.allclose(old.to_vectors(rows), new.to_vectors(rows) @ new.vector_map_from(old).T)
+
+    outputs = Vectoriser(include_constant=False)
+    outputs.fit(old_rows)
+    # maps that give each row's output vector from its (old) input vector
+    maps = np.linalg.lstsq(old.to_vectors(old_rows), outputs.to_vectors(old_rows), rcond=None)[0].T
+    new_outputs = outputs.extended(new_rows)
+    converted = new_outputs.convert_maps(maps[None], outputs)[0]
+    assert np.allclose(old.to_vectors(old_rows) @ converted.T, new_outputs.to_vectors(old_rows))